@@ -0,0 +1,54 @@
+"""
+MicroNFCBoard Python API
+
+Copyright (c) 2014-2015 AppNearMe Ltd
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import gc
+
+# Counters shared by the benchmarks, each measured in its own pass so that timings are not affected
+
+def retainedObjects(operation, iterations):
+    """
+    Returns the GC-tracked objects left behind per operation
+    This is a net difference: it shows leaks and growing caches, not transient allocations,
+    which Python 2.7 cannot count (gc.get_count() is decremented when objects are freed)
+    """
+    operation() #Warm up
+    gc.collect()
+    gc.disable()
+    try:
+        objects = len(gc.get_objects())
+        for _ in xrange(iterations):
+            operation()
+        objects = len(gc.get_objects()) - objects
+    finally:
+        gc.enable()
+    return float(objects) / iterations
+
+def reportsPerOp(board, operation, iterations):
+    """
+    Returns the USB reports exchanged with board per operation, counted with the transport statistics
+    (which are reset, and disabled again afterwards unless they were enabled)
+    """
+    enabled = board.stats() != None
+    board.enableStats()
+    try:
+        board.resetStats()
+        for _ in xrange(iterations):
+            operation()
+        return float(board.stats()['calls']) / iterations
+    finally:
+        board.enableStats(enabled)
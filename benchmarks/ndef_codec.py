@@ -0,0 +1,52 @@
+"""
+MicroNFCBoard Python API
+
+Copyright (c) 2014-2015 AppNearMe Ltd
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from timeit import default_timer
+from micronfcboard.nfc.ndef import encodeMessage, decodeMessage, URIRecord, TextRecord, SmartPosterRecord, MIMERecord
+
+DURATION = 1.0
+
+MESSAGES = [ ("URI", [URIRecord("http://www.micronfcboard.com/")], None),
+             ("Smart poster", [SmartPosterRecord([URIRecord("http://www.micronfcboard.com/"), TextRecord("MicroNFCBoard", "en")])], None),
+             ("MIME 4kB", [MIMERecord("application/octet-stream", bytearray(4096))], None),
+             ("MIME 4kB chunked", [MIMERecord("application/octet-stream", bytearray(4096))], 255),
+           ]
+
+def throughput(func, size):
+    """
+    Returns MB/s processed by func over DURATION seconds
+    """
+    func() #Warm up
+    iterations = 0
+    start = default_timer()
+    while True:
+        func()
+        iterations += 1
+        elapsed = default_timer() - start
+        if elapsed >= DURATION:
+            break
+    return size * iterations / elapsed / 1e6
+
+for name, records, chunkSize in MESSAGES:
+    message = encodeMessage(records, chunkSize)
+    encoding = throughput(lambda: encodeMessage(records, chunkSize), len(message))
+    decoding = throughput(lambda: decodeMessage(message), len(message))
+    print("%-18s %6d bytes %8.2f MB/s encode %8.2f MB/s decode" % (name, len(message), encoding, decoding))
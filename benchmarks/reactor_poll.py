@@ -0,0 +1,65 @@
+"""
+MicroNFCBoard Python API
+
+Copyright (c) 2014-2015 AppNearMe Ltd
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from threading import Thread
+from timeit import default_timer
+from micronfcboard.board import MicroNFCBoard
+from micronfcboard.interface.simulator_backend import SimulatorUSB
+from micronfcboard.reactor import Reactor
+
+# Usage: python benchmarks/reactor_poll.py [boards...]
+
+DURATION = 1.0 #Seconds
+
+def measure(count):
+    """
+    Returns the GET_STATUS commands per second completed by one reactor thread driving count boards
+    """
+    boards = [MicroNFCBoard(SimulatorUSB()) for _ in range(count)]
+    reactor = Reactor()
+    polls = [0]
+    end = [None]
+    for board in boards:
+        board.open()
+        reactor.add(board, 1, 1)
+
+    def poll(board):
+        def done(result, error):
+            polls[0] += 1
+            if default_timer() < end[0]:
+                poll(board)
+        reactor.submit(board, [('GET_STATUS',)], done)
+
+    thread = Thread(target = reactor.run)
+    thread.start()
+    end[0] = default_timer() + DURATION
+    for board in boards:
+        poll(board)
+    thread.join(DURATION + 1)
+    reactor.stop()
+    thread.join()
+    reactor.close()
+    for board in boards:
+        board.close()
+    return polls[0] / DURATION
+
+for count in [int(arg) for arg in sys.argv[1:]] or [1, 4, 16]:
+    print("%3d boards %10.0f polls/s" % (count, measure(count)))
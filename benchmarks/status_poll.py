@@ -0,0 +1,57 @@
+"""
+MicroNFCBoard Python API
+
+Copyright (c) 2014-2015 AppNearMe Ltd
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from timeit import default_timer
+from micronfcboard.board import MicroNFCBoard
+from micronfcboard.interface.simulator_backend import SimulatorUSB
+from harness import retainedObjects, reportsPerOp
+
+POLLS = 100000
+
+def measure(poll, polls):
+    """
+    Returns microseconds per poll
+    """
+    poll() #Warm up
+    start = default_timer()
+    for _ in xrange(polls):
+        poll()
+    return (default_timer() - start) * 1e6 / polls
+
+board = MicroNFCBoard(SimulatorUSB())
+board.open()
+
+def report(name, poll):
+    reports = reportsPerOp(board, poll, POLLS // 10)
+    objects = retainedObjects(poll, POLLS)
+    us = measure(poll, POLLS)
+    print("%-24s %8.2f us/poll %8.4f reports/poll %8.4f retained objects/poll" % (name, us, reports, objects))
+
+report("Transport.status()", board._transport.status)
+report("MicroNFCBoard.connected", lambda: board.connected)
+board.setStatusTTL(0.01)
+report("connected, 10 ms TTL", lambda: board.connected)
+board.setStatusTTL(0)
+
+board.enableStats()
+report("Transport.status() stats", board._transport.status)
+
+board.close()
@@ -0,0 +1,188 @@
+"""
+MicroNFCBoard Python API
+
+Copyright (c) 2014-2015 AppNearMe Ltd
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+from argparse import ArgumentParser
+from timeit import default_timer
+from micronfcboard.board import MicroNFCBoard
+from micronfcboard.interface.simulator_backend import SimulatorUSB, SimulatedTag
+from micronfcboard.nfc.ndef import URIRecord, TextRecord, SmartPosterRecord, MIMERecord
+from harness import retainedObjects, reportsPerOp
+
+# Usage: python benchmarks/suite.py [--output results.json] [--baseline baseline.json [--threshold 10]]
+
+REPEAT = 7
+MIN_TIME = 0.05 #Minimum duration of a run, in seconds
+
+def calibrate(operation, minTime):
+    """
+    Returns a number of iterations of operation lasting at least minTime
+    """
+    iterations = 1
+    while True:
+        start = default_timer()
+        for _ in xrange(iterations):
+            operation()
+        if default_timer() - start >= minTime:
+            return iterations
+        iterations *= 2
+
+def measure(board, operation, minTime):
+    """
+    Returns the best time per operation in seconds over REPEAT runs, the USB reports exchanged
+    and the GC-tracked objects retained per operation
+    """
+    iterations = calibrate(operation, minTime)
+    best = None
+    for _ in range(REPEAT):
+        start = default_timer()
+        for _ in xrange(iterations):
+            operation()
+        elapsed = (default_timer() - start) / iterations
+        if (best == None) or (elapsed < best):
+            best = elapsed
+    return best, reportsPerOp(board, operation, iterations), retainedObjects(operation, iterations)
+
+def openBoard(latency, window, records = None, negotiate = False):
+    """
+    Returns a board on the simulator, transferring records in the default 40-byte chunks
+    unless negotiate is True
+    """
+    intf = SimulatorUSB()
+    board = MicroNFCBoard(intf)
+    board.open()
+    if negotiate:
+        board.negotiateChunkSizes()
+    board.setPipelineWindow(window)
+    intf.latency = latency
+    intf.placeTag(SimulatedTag(records = records))
+    board.startPolling(True, False, False)
+    if records != None:
+        board.ndefRead()
+    return board
+
+def uriMessage(count):
+    return [URIRecord("http://www.micronfcboard.com/%d" % (i,)) for i in range(count)]
+
+def mimeMessage(size):
+    return [MIMERecord("application/octet-stream", bytearray(i % 256 for i in range(size)))]
+
+def smartPosterMessage(count):
+    return [SmartPosterRecord([URIRecord("http://www.micronfcboard.com/%d" % (i,)), TextRecord("MicroNFCBoard %d" % (i,), "en")]) for i in range(count)]
+
+READ_MESSAGES = [ ("read 1 URI", uriMessage(1)), ("read 10 URIs", uriMessage(10)), ("read 100 URIs", uriMessage(100)),
+                  ("read 0.1 kB MIME", mimeMessage(100)), ("read 1 kB MIME", mimeMessage(1000)), ("read 8 kB MIME", mimeMessage(8000)) ]
+
+WRITE_MESSAGES = [ ("upload 1 URI", uriMessage(1)), ("upload 10 URIs", uriMessage(10)), ("upload 10 smart posters", smartPosterMessage(10)),
+                   ("upload 1 kB MIME", mimeMessage(1000)), ("upload 8 kB MIME", mimeMessage(8000)) ]
+
+#Suffix of the result names and whether chunk sizes are negotiated
+CHUNKS = [ ("", False), (", negotiated chunks", True) ]
+
+def result(value, unit, higherIsBetter = False):
+    return { 'value': value, 'unit': unit, 'higherIsBetter': higherIsBetter }
+
+def run(latency, window, scale):
+    results = {}
+    
+    board = openBoard(latency, window)
+    seconds, reports, objects = measure(board, board._transport.status, MIN_TIME * scale)
+    results["status"] = result(1.0 / seconds, "calls/s", True)
+    results["status reports"] = result(reports, "reports/op")
+    results["status retained"] = result(objects, "retained objects/op")
+    board.close()
+    
+    for suffix, negotiate in CHUNKS:
+        for name, records in READ_MESSAGES:
+            board = openBoard(latency, window, records, negotiate)
+            seconds, reports, objects = measure(board, board._getNdefMessageRecords, MIN_TIME * scale)
+            results[name + suffix] = result(seconds * 1e3, "ms")
+            results[name + suffix + " reports"] = result(reports, "reports/op")
+            results[name + suffix + " retained"] = result(objects, "retained objects/op")
+            board.close()
+        
+        for name, records in WRITE_MESSAGES:
+            board = openBoard(latency, window, None, negotiate)
+            def upload():
+                board.invalidateStagedMessage() #Upload every time
+                board.stageMessage(records)
+            seconds, reports, objects = measure(board, upload, MIN_TIME * scale)
+            results[name + suffix] = result(seconds * 1e3, "ms")
+            results[name + suffix + " reports"] = result(reports, "reports/op")
+            results[name + suffix + " retained"] = result(objects, "retained objects/op")
+            board.close()
+    
+    return results
+
+def regressions(results, baseline, threshold):
+    """
+    Returns (name, baseline value, value, change in percent) for each result worse than baseline by more than threshold percent
+    Report counts are exact, so any increase is a regression; retained object counts are compared
+    with an absolute tolerance of half an object, since their baseline is often 0
+    """
+    regressed = []
+    for name, entry in sorted(results.items()):
+        if name not in baseline:
+            continue
+        reference = baseline[name]['value']
+        value = entry['value']
+        change = 100.0 * (value - reference) / reference if reference != 0 else 0.0
+        if entry['unit'] == "reports/op":
+            worse = value > reference
+        elif entry['unit'] == "retained objects/op":
+            worse = value - reference > max(0.5, abs(reference) * threshold / 100.0)
+        elif entry['higherIsBetter']:
+            worse = change < -threshold
+        else:
+            worse = change > threshold
+        if worse:
+            regressed.append((name, reference, value, change))
+    return regressed
+
+def main():
+    parser = ArgumentParser(description = "MicroNFCBoard host side benchmarks, run against the simulator")
+    parser.add_argument("--output", metavar = "FILE", help = "write the results as JSON to FILE")
+    parser.add_argument("--baseline", metavar = "FILE", help = "compare with the results saved in FILE and fail on regressions")
+    parser.add_argument("--threshold", type = float, default = 10.0, help = "regression threshold in percent (default 10)")
+    parser.add_argument("--latency", type = float, default = 0.0, help = "simulated USB latency in seconds (default 0)")
+    parser.add_argument("--window", type = int, default = 1, help = "pipeline window (default 1)")
+    parser.add_argument("--scale", type = float, default = 1.0, help = "multiply the duration of each run")
+    options = parser.parse_args()
+    
+    results = run(options.latency, options.window, options.scale)
+    for name, entry in sorted(results.items()):
+        print("%-48s %12.4f %s" % (name, entry['value'], entry['unit']))
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump({ 'benchmarks': results, 'latency': options.latency, 'window': options.window }, f, indent = 2, sort_keys = True)
+    
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)['benchmarks']
+        regressed = regressions(results, baseline, options.threshold)
+        for name, reference, value, change in regressed:
+            print("REGRESSION %-48s %12.4f -> %12.4f (%+.1f%%)" % (name, reference, value, change))
+        if len(regressed) > 0:
+            sys.exit(1)
+        print("No regression beyond %.1f%%" % (options.threshold,))
+
+if __name__ == "__main__":
+    main()
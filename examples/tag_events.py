@@ -0,0 +1,66 @@
+"""
+MicroNFCBoard Python API
+
+Copyright (c) 2014-2015 AppNearMe Ltd
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Queue import Queue
+from micronfcboard.board import MicroNFCBoard
+from micronfcboard.events import ConnectedEvent, NdefReadableEvent, NdefPresentEvent, DisconnectedEvent, ErrorEvent
+
+board = MicroNFCBoard.getBoard()
+
+if( board == None ):
+    print("Board not found")
+    exit()
+
+board.open()
+
+print("Connected to board id %s (version %d.%d)" % (board.id, board.version[0], board.version[1]) )
+
+events = Queue()
+board.addEventListener(events)
+board.startEvents()
+
+print("Start polling")
+board.startPolling(True, False, False)
+
+while True:
+    event = events.get()
+    if isinstance(event, ConnectedEvent):
+        if not event.snapshot.type2Tag:
+            print("Could not connect")
+            break
+        atqa, sak, uid = board.getNfcInfo()
+        print("ISO A tag detected: ATQA: %s, SAK: %s, UID %s" % (atqa, sak, uid,))
+    elif isinstance(event, NdefReadableEvent):
+        print("Reading tag")
+        board.ndefRead()
+    elif isinstance(event, NdefPresentEvent):
+        print("Message read:")
+        for record in board.ndefRecords:
+            print record
+    elif isinstance(event, DisconnectedEvent):
+        print("Disconnnected")
+        break
+    elif isinstance(event, ErrorEvent):
+        print("Polling error: %s" % (event.error,))
+
+board.close()
+
+exit()
@@ -51,19 +51,21 @@ else:
 ndefMessageWritten = False
 ndefWritingStarted = False
 
-while board.connected:
-    if not ndefWritingStarted and board.ndefWriteable:
+status = board.snapshot()
+while status.connected:
+    if not ndefWritingStarted and status.ndefWriteable:
         print("Writing tag")
         ndefWritingStarted = True
         board.ndefRecords = [SmartPosterRecord([URIRecord("http://www.micronfcboard.com/"), TextRecord("MicroNFCBoard", "en")])]
         board.ndefWrite()
-    if ndefWritingStarted and (not ndefMessageWritten) and (not board.ndefBusy):
+    elif ndefWritingStarted and (not ndefMessageWritten) and (not status.ndefBusy):
         ndefMessageWritten = True
-        if board.ndefSuccess:
+        if status.ndefSuccess:
             print("Tag write successful")
         else:
             print("Tag write failed")
     sleep(0.1)
+    status = board.snapshot()
 
 print("Disconnnected")
 
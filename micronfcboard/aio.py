@@ -0,0 +1,267 @@
+"""
+MicroNFCBoard Python API
+
+Copyright (c) 2014-2015 AppNearMe Ltd
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import logging
+from timeit import default_timer
+
+try:
+    import asyncio
+except ImportError:
+    try:
+        import trollius as asyncio
+    except ImportError:
+        logging.debug("asyncio (or trollius on Python 2) is required for AsyncMicroNFCBoard")
+        asyncio = None
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
+from board import MicroNFCBoard
+from events import FAST_INTERVAL, SLOW_INTERVAL
+from reactor import Reactor
+
+isAvailable = (asyncio != None) and (ThreadPoolExecutor != None)
+
+class AsyncMicroNFCBoard(object):
+    """
+    asyncio front-end of a MicroNFCBoard: methods return futures that can be awaited
+    (or yielded from with trollius), the blocking USB I/O running on a dedicated
+    executor thread per board
+    """
+    @staticmethod
+    def getBoard(number = 0, loop = None):
+        board = MicroNFCBoard.getBoard(number)
+        if board == None:
+            return None
+        return AsyncMicroNFCBoard(board, loop)
+    
+    @staticmethod
+    def getAllBoards(loop = None):
+        return [AsyncMicroNFCBoard(board, loop) for board in MicroNFCBoard.getAllBoards()]
+    
+    def __init__(self, board, loop = None):
+        self._board = board
+        self._loop = loop if loop != None else asyncio.get_event_loop()
+        self._executor = ThreadPoolExecutor(max_workers = 1)
+        
+    @property
+    def board(self):
+        return self._board
+    
+    @property
+    def id(self):
+        return self._board.id
+    
+    @property
+    def version(self):
+        return self._board.version
+    
+    def _run(self, func, *args):
+        return self._loop.run_in_executor(self._executor, func, *args)
+    
+    def open(self):
+        return self._run(self._board.open)
+    
+    def close(self):
+        future = self._run(self._board.close)
+        future.add_done_callback(lambda f: self._executor.shutdown(wait = False))
+        return future
+    
+    def snapshot(self):
+        return self._run(self._board.snapshot)
+    
+    def getNfcInfo(self):
+        return self._run(self._board.getNfcInfo)
+    
+    def reset(self):
+        return self._run(self._board.reset)
+    
+    def startPolling(self, readerWriter, emulator, p2p):
+        return self._run(self._board.startPolling, readerWriter, emulator, p2p)
+    
+    def stopPolling(self):
+        return self._run(self._board.stopPolling)
+    
+    def ndefRead(self):
+        return self._run(self._board.ndefRead)
+    
+    def ndefWrite(self):
+        return self._run(self._board.ndefWrite)
+    
+    def getNdefRecords(self):
+        return self._run(lambda: self._board.ndefRecords)
+    
+    def setNdefRecords(self, records):
+        def setRecords():
+            self._board.ndefRecords = records
+        return self._run(setRecords)
+    
+    def setLeds(self, led1, led2):
+        return self._run(self._board.setLeds, led1, led2)
+    
+    def waitFor(self, predicate, timeout = None, interval = FAST_INTERVAL):
+        """
+        Returns a future resolved with the first StatusSnapshot for which predicate is true,
+        polled every interval seconds; it fails with asyncio.TimeoutError after timeout seconds
+        """
+        result = asyncio.Future(loop = self._loop)
+        
+        def poll():
+            if not result.done():
+                self._run(self._board.snapshot).add_done_callback(check)
+        
+        def check(future):
+            if result.done():
+                return
+            if future.exception() != None:
+                result.set_exception(future.exception())
+            elif predicate(future.result()):
+                result.set_result(future.result())
+            else:
+                self._loop.call_later(interval, poll)
+                
+        def expire():
+            if not result.done():
+                result.set_exception(asyncio.TimeoutError())
+        
+        if timeout != None:
+            handle = self._loop.call_later(timeout, expire)
+            result.add_done_callback(lambda f: handle.cancel())
+        poll()
+        return result
+
+class LoopPoller(object):
+    """
+    Lets an asyncio event loop wait for the file descriptors and timers of a Reactor
+    """
+    def __init__(self, loop):
+        self._loop = loop
+        self._reactor = None
+        self._handle = None
+        self._running = False
+        
+    def bind(self, reactor):
+        self._reactor = reactor
+        
+    def register(self, fd):
+        self._loop.add_reader(fd, self._ready, fd)
+        
+    def unregister(self, fd):
+        self._loop.remove_reader(fd)
+        
+    def reschedule(self, deadline):
+        if self._running: #Rescheduled once the timers due have run
+            return
+        if self._handle != None:
+            self._handle.cancel()
+        self._handle = self._loop.call_later(max(0, deadline - default_timer()), self._timers)
+        
+    def poll(self, timeout):
+        raise RuntimeError("The reactor is driven by the asyncio event loop")
+    
+    def close(self):
+        if self._handle != None:
+            self._handle.cancel()
+            self._handle = None
+        
+    def _ready(self, fd):
+        self._reactor._ready(fd)
+        
+    def _timers(self):
+        self._handle = None
+        self._running = True
+        try:
+            delay = self._reactor._runTimers()
+        finally:
+            self._running = False
+        if delay != None:
+            self._handle = self._loop.call_later(delay, self._timers)
+
+class AsyncReactor(object):
+    """
+    asyncio front-end of a Reactor: the boards are driven from the event loop itself, without
+    executor threads for boards exposing a file descriptor, and methods return futures
+    """
+    def __init__(self, loop = None):
+        self._loop = loop if loop != None else asyncio.get_event_loop()
+        self._reactor = Reactor(LoopPoller(self._loop))
+        
+    @property
+    def reactor(self):
+        return self._reactor
+    
+    def add(self, board, fastInterval = FAST_INTERVAL, slowInterval = SLOW_INTERVAL):
+        self._reactor.add(board, fastInterval, slowInterval)
+        
+    def remove(self, board):
+        self._reactor.remove(board)
+        
+    def close(self):
+        self._reactor.close()
+        
+    def _future(self):
+        future = asyncio.Future(loop = self._loop)
+        def done(result, error):
+            if future.cancelled():
+                return
+            if error != None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        return future, done
+    
+    def submit(self, board, commands):
+        future, done = self._future()
+        self._reactor.submit(board, commands, done)
+        return future
+    
+    def startPolling(self, board, readerWriter, emulator, p2p):
+        future, done = self._future()
+        self._reactor.startPolling(board, readerWriter, emulator, p2p, done)
+        return future
+    
+    def stopPolling(self, board):
+        future, done = self._future()
+        self._reactor.stopPolling(board, done)
+        return future
+    
+    def ndefRead(self, board):
+        future, done = self._future()
+        self._reactor.ndefRead(board, done)
+        return future
+    
+    def ndefWrite(self, board):
+        future, done = self._future()
+        self._reactor.ndefWrite(board, done)
+        return future
+    
+    def setLeds(self, board, led1, led2):
+        future, done = self._future()
+        self._reactor.setLeds(board, led1, led2, done)
+        return future
+    
+    def readMessage(self, board):
+        future, done = self._future()
+        self._reactor.readMessage(board, done)
+        return future
+    
+    def stageMessage(self, board, records, progress = None):
+        future, done = self._future()
+        self._reactor.stageMessage(board, records, done, progress)
+        return future
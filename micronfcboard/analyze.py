@@ -0,0 +1,305 @@
+"""
+MicroNFCBoard Python API
+
+Copyright (c) 2014-2015 AppNearMe Ltd
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import sys
+import json
+from argparse import ArgumentParser
+from bisect import bisect_left
+from collections import deque
+
+from transport import COMMAND_ID, COMMAND_NAME
+from status import STATUS_CONNECTED
+from interface.trace import readTrace, TRACE_MAGIC, TRACE_WRITE, TRACE_READ, TRACE_ERROR, TRACE_HEADER, TRACE_RECORD_SIZE
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Usage: python -m micronfcboard.analyze session.trace [--chrome timeline.json] [--json]
+
+GET_STATUS = COMMAND_ID['GET_STATUS']
+RESET = COMMAND_ID['RESET'] #The only command without a response
+NDEF_COMMANDS = [ COMMAND_ID[name] for name in ('NFC_GET_MESSAGE_INFO', 'NFC_GET_RECORD_INFO', 'NFC_GET_RECORD_DATA',
+                                                'NFC_SET_MESSAGE_INFO', 'NFC_SET_RECORD_INFO', 'NFC_SET_RECORD_DATA',
+                                                'NFC_PREPARE_MESSAGE') ]
+PERCENTILES = (50, 90, 99)
+
+class Exchanges(object):
+    """
+    Columns describing each command of a trace matched with its response: command code,
+    response status (-1 for read errors), start and end in seconds and status word (GET_STATUS only)
+    Columns are NumPy arrays when NumPy is available, lists otherwise
+    """
+    def __init__(self, code, status, start, end, word):
+        self.code = code
+        self.status = status
+        self.start = start
+        self.end = end
+        self.word = word
+        
+    def __len__(self):
+        return len(self.code)
+
+def loadExchanges(data, useNumpy = True):
+    """
+    Match the commands of a trace held in a buffer with their responses, which the firmware sends in order
+    """
+    if (numpy != None) and useNumpy:
+        exchanges = _loadExchangesNumpy(data)
+        if exchanges != None:
+            return exchanges
+    return _loadExchangesPython(data)
+
+def _loadExchangesPython(data):
+    pending = deque()
+    code, status, start, end, word = [], [], [], [], []
+    for kind, timestamp, report in readTrace(data):
+        if kind == TRACE_WRITE:
+            if report[0] != RESET:
+                pending.append((report[0], timestamp))
+            continue
+        if (len(pending) == 0) or ((kind == TRACE_READ) and (report[0] != pending[0][0])):
+            continue #Late response to a command that timed out or was sent before the trace started
+        commandCode, sent = pending.popleft()
+        code.append(commandCode)
+        start.append(sent)
+        end.append(timestamp)
+        if kind == TRACE_ERROR:
+            status.append(-1)
+            word.append(0)
+        else:
+            status.append(report[1])
+            word.append(((report[2] << 24) | (report[3] << 16) | (report[4] << 8) | report[5]) if commandCode == GET_STATUS else 0)
+    return Exchanges(code, status, start, end, word)
+
+def _loadExchangesNumpy(data):
+    if bytes(data[0:len(TRACE_MAGIC)]) != TRACE_MAGIC:
+        raise ValueError("Not a trace file")
+    count = (len(data) - len(TRACE_MAGIC)) // TRACE_RECORD_SIZE
+    records = numpy.frombuffer(data, numpy.uint8, count * TRACE_RECORD_SIZE, len(TRACE_MAGIC)).reshape(count, TRACE_RECORD_SIZE)
+    kind = records[:, 0]
+    timestamp = records[:, 8:16].copy().view("<u8").ravel() / 1e9
+    report = records[:, TRACE_HEADER.size:]
+    
+    #The n-th response answers the n-th command
+    sentIndex = numpy.flatnonzero((kind == TRACE_WRITE) & (report[:, 0] != RESET))
+    readIndex = numpy.flatnonzero((kind == TRACE_READ) | (kind == TRACE_ERROR))
+    n = min(len(sentIndex), len(readIndex))
+    sentIndex, readIndex = sentIndex[:n], readIndex[:n]
+    
+    code = report[sentIndex, 0].astype(numpy.int32)
+    error = kind[readIndex] == TRACE_ERROR
+    if numpy.any((sentIndex > readIndex) | (~error & (report[readIndex, 0] != code))):
+        return None #Late responses, leave the matching to the exact loop
+    status = numpy.where(error, -1, report[readIndex, 1].astype(numpy.int32))
+    word = report[readIndex, 2:6].astype(numpy.uint32)
+    word = (word[:, 0] << 24) | (word[:, 1] << 16) | (word[:, 2] << 8) | word[:, 3]
+    word = numpy.where((code == GET_STATUS) & ~error, word, 0)
+    return Exchanges(code, status, timestamp[sentIndex], timestamp[readIndex], word)
+
+def _percentiles(values):
+    if len(values) == 0:
+        return dict([("p%d" % p, 0.0) for p in PERCENTILES])
+    if numpy != None and isinstance(values, numpy.ndarray):
+        return dict([("p%d" % p, float(v)) for p, v in zip(PERCENTILES, numpy.percentile(values, PERCENTILES))])
+    values = sorted(values)
+    result = {}
+    for p in PERCENTILES:
+        #Linear interpolation between closest ranks, as numpy.percentile
+        rank = (len(values) - 1) * p / 100.0
+        low = int(rank)
+        high = min(low + 1, len(values) - 1)
+        result["p%d" % p] = values[low] + (values[high] - values[low]) * (rank - low)
+    return result
+
+def _commandStats(exchanges):
+    commands = {}
+    if isinstance(exchanges.code, list):
+        durations = {}
+        for code, start, end in zip(exchanges.code, exchanges.start, exchanges.end):
+            durations.setdefault(code, []).append(end - start)
+        groups = durations.items()
+    else:
+        duration = exchanges.end - exchanges.start
+        order = numpy.argsort(exchanges.code, kind = "mergesort")
+        codes, first = numpy.unique(exchanges.code[order], return_index = True)
+        groups = zip(codes, numpy.split(duration[order], first[1:]))
+    for code, duration in groups:
+        if isinstance(duration, list):
+            stats = { 'calls': len(duration), 'max': max(duration), 'total': sum(duration) }
+        else:
+            stats = { 'calls': len(duration), 'max': float(duration.max()), 'total': float(duration.sum()) }
+        stats.update(_percentiles(duration))
+        commands[COMMAND_NAME.get(int(code), str(code))] = stats
+    return commands
+
+def _categories(exchanges):
+    polling = transfer = other = 0.0
+    if isinstance(exchanges.code, list):
+        for code, start, end in zip(exchanges.code, exchanges.start, exchanges.end):
+            if code == GET_STATUS:
+                polling += end - start
+            elif code in NDEF_COMMANDS:
+                transfer += end - start
+            else:
+                other += end - start
+    else:
+        duration = exchanges.end - exchanges.start
+        isPolling = exchanges.code == GET_STATUS
+        isTransfer = numpy.in1d(exchanges.code, NDEF_COMMANDS)
+        polling = float(duration[isPolling].sum())
+        transfer = float(duration[isTransfer].sum())
+        other = float(duration[~(isPolling | isTransfer)].sum())
+    return { 'idlePolling': polling, 'ndefTransfer': transfer, 'other': other }
+
+def _transitions(exchanges):
+    """
+    Returns the (time, connected) pairs of the GET_STATUS responses where the connected bit changes
+    """
+    if isinstance(exchanges.code, list):
+        transitions = []
+        for code, status, end, word in zip(exchanges.code, exchanges.status, exchanges.end, exchanges.word):
+            if (code == GET_STATUS) and (status == 0):
+                connected = (word & STATUS_CONNECTED) != 0
+                if (len(transitions) == 0) or (transitions[-1][1] != connected):
+                    transitions.append((end, connected))
+        return transitions
+    polls = (exchanges.code == GET_STATUS) & (exchanges.status == 0)
+    connected = (exchanges.word[polls] & STATUS_CONNECTED) != 0
+    times = exchanges.end[polls]
+    if len(connected) == 0:
+        return []
+    changes = numpy.concatenate(([0], numpy.flatnonzero(connected[1:] != connected[:-1]) + 1))
+    return [(float(times[i]), bool(connected[i])) for i in changes]
+
+def _sessions(exchanges):
+    """
+    Returns (start, end) of each tag session, from the first poll seeing the tag connected to the first one seeing it gone
+    """
+    sessions = []
+    start = None
+    for time, connected in _transitions(exchanges):
+        if connected:
+            start = time
+        elif start != None:
+            sessions.append((start, time))
+            start = None
+    return sessions
+
+def _sessionStats(exchanges, sessions):
+    if isinstance(exchanges.start, list):
+        roundTrips = [bisect_left(exchanges.start, end) - bisect_left(exchanges.start, start) for start, end in sessions]
+    else:
+        bounds = numpy.searchsorted(exchanges.start, numpy.array(sessions, dtype = float).reshape(-1, 2))
+        roundTrips = list(bounds[:, 1] - bounds[:, 0])
+    durations = [end - start for start, end in sessions]
+    stats = { 'sessions': len(sessions),
+              'roundTrips': _percentiles(roundTrips),
+              'duration': _percentiles(durations),
+            }
+    stats['roundTrips']['mean'] = float(sum(roundTrips)) / len(roundTrips) if roundTrips else 0.0
+    stats['roundTrips']['max'] = int(max(roundTrips)) if roundTrips else 0
+    return stats
+
+def analyze(exchanges):
+    """
+    Returns the report of a trace as a dict
+    """
+    return { 'exchanges': len(exchanges),
+             'duration': float(exchanges.end[-1] - exchanges.start[0]) if len(exchanges) else 0.0,
+             'commands': _commandStats(exchanges),
+             'time': _categories(exchanges),
+             'sessions': _sessionStats(exchanges, _sessions(exchanges)),
+           }
+
+def _pollingRuns(exchanges):
+    """
+    Returns the (first, last) indices of each run of consecutive GET_STATUS exchanges, and the indices of the other exchanges
+    """
+    if isinstance(exchanges.code, list):
+        runs = []
+        others = []
+        for i, code in enumerate(exchanges.code):
+            if code != GET_STATUS:
+                others.append(i)
+            elif (len(runs) > 0) and (runs[-1][1] == i - 1):
+                runs[-1] = (runs[-1][0], i)
+            else:
+                runs.append((i, i))
+        return runs, others
+    isPolling = exchanges.code == GET_STATUS
+    edges = numpy.diff(numpy.concatenate(([0], isPolling.view(numpy.int8), [0])))
+    first = numpy.flatnonzero(edges == 1)
+    last = numpy.flatnonzero(edges == -1) - 1
+    return zip(first.tolist(), last.tolist()), numpy.flatnonzero(~isPolling).tolist()
+
+def chromeTrace(exchanges):
+    """
+    Returns a Chrome trace-event timeline (chrome://tracing) of the exchanges,
+    consecutive GET_STATUS exchanges being merged in a single idle polling event
+    """
+    #Columns as lists of Python numbers, converted at once rather than element by element
+    code, status, start, end = [column if isinstance(column, list) else column.tolist()
+                                for column in (exchanges.code, exchanges.status, exchanges.start, exchanges.end)]
+    runs, others = _pollingRuns(exchanges)
+    events = []
+    for first, last in runs:
+        events.append((first, { 'name': 'idle polling', 'cat': 'polling', 'ph': 'X', 'ts': start[first] * 1e6, 'dur': (end[last] - start[first]) * 1e6,
+                                'pid': 1, 'tid': 1, 'args': { 'polls': last - first + 1 } }))
+    for i in others:
+        events.append((i, { 'name': COMMAND_NAME.get(code[i], str(code[i])), 'cat': 'ndef' if code[i] in NDEF_COMMANDS else 'command', 'ph': 'X',
+                            'ts': start[i] * 1e6, 'dur': (end[i] - start[i]) * 1e6, 'pid': 1, 'tid': 2, 'args': { 'status': status[i] } }))
+    events.sort(key = lambda event: event[0])
+    return { 'traceEvents': [event for i, event in events], 'displayTimeUnit': 'ms' }
+
+def printReport(report, out = sys.stdout):
+    out.write("%d exchanges over %.3f s\n\n" % (report['exchanges'], report['duration']))
+    out.write("%-22s %10s %10s %10s %10s %10s %10s\n" % ("Command", "Calls", "p50 ms", "p90 ms", "p99 ms", "Max ms", "Total s"))
+    for name, stats in sorted(report['commands'].items(), key = lambda item: -item[1]['total']):
+        out.write("%-22s %10d %10.3f %10.3f %10.3f %10.3f %10.3f\n" % (name, stats['calls'], stats['p50'] * 1e3, stats['p90'] * 1e3,
+                                                                   stats['p99'] * 1e3, stats['max'] * 1e3, stats['total']))
+    time = report['time']
+    out.write("\nIdle polling %.3f s, NDEF transfer %.3f s, other commands %.3f s\n" % (time['idlePolling'], time['ndefTransfer'], time['other']))
+    sessions = report['sessions']
+    out.write("%d tag sessions, round trips per session: p50 %.0f, mean %.1f, max %d, session duration p50 %.3f s\n" %
+              (sessions['sessions'], sessions['roundTrips']['p50'], sessions['roundTrips']['mean'], sessions['roundTrips']['max'], sessions['duration']['p50']))
+
+def main(args = None):
+    parser = ArgumentParser(prog = "python -m micronfcboard.analyze", description = "Latency breakdown of a trace recorded with TraceRecorder")
+    parser.add_argument("trace")
+    parser.add_argument("--chrome", metavar = "FILE", help = "write a Chrome trace-event timeline to FILE")
+    parser.add_argument("--json", action = "store_true", help = "print the report as JSON")
+    parser.add_argument("--no-numpy", dest = "numpy", action = "store_false", help = "do not use NumPy")
+    options = parser.parse_args(args)
+    
+    with open(options.trace, "rb") as f:
+        data = bytearray(f.read())
+    exchanges = loadExchanges(data, options.numpy)
+    report = analyze(exchanges)
+    if options.json:
+        json.dump(report, sys.stdout, indent = 2, sort_keys = True)
+        sys.stdout.write("\n")
+    else:
+        printReport(report)
+    if options.chrome:
+        with open(options.chrome, "w") as f:
+            json.dump(chromeTrace(exchanges), f)
+
+if __name__ == "__main__":
+    main()
@@ -15,44 +15,39 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
-from array import array
+from time import time
 
 from interface import INTERFACE, usb_backend
-from transport import Transport
+from transport import Transport, BoardError
+from status import *
+from events import EventDispatcher, StatusPoller, FAST_INTERVAL, SLOW_INTERVAL
 
 from nfc.ndef import URIRecord, TextRecord, SmartPosterRecord, MIMERecord
+from nfc import uri
+from message import MessageCompiler, MessageReader, CompiledMessage, SmartPosterNestingException, TEXT_ENCODING, ITEM_LENGTH_FIELDS
+from lazy import LazyURIRecord, LazyTextRecord, LazySmartPosterRecord, LazyMIMERecord
+from mmap import mmap
+import logging
 
 VID = 0x1FC9 #NXP VID
 PID = 0x8039 #Attributed to AppNearMe
 
 TARGET_FIRMWARE = (1, 4)
 
-STATUS_POLLING        = (1 << 0)
-STATUS_CONNECTED      = (1 << 1)
-STATUS_NDEF_PRESENT   = (1 << 2)
-STATUS_NDEF_READABLE  = (1 << 3)
-STATUS_NDEF_WRITEABLE = (1 << 4)
-STATUS_NDEF_BUSY      = (1 << 5)
-STATUS_NDEF_SUCCESS   = (1 << 6)
+CHUNK_SIZE = 40 #Chunk size accepted by every firmware
+#Chunk sizes tried by negotiateChunkSizes(), largest first: a GET_RECORD_DATA response carries up to 62 bytes
+#after the code and status bytes, a SET_RECORD_DATA request up to 56 after its 8 bytes header
+READ_CHUNK_SIZES = (62, 48, CHUNK_SIZE)
+WRITE_CHUNK_SIZES = (56, 48, CHUNK_SIZE)
+STREAM_BATCH = 32 #Chunks requested in one batch when streaming a record item
 
-STATUS_TYPE_MASK      = (0xFF << 8)
-STATUS_TYPE1          = (1 << 8)
-STATUS_TYPE2          = (2 << 8)
-STATUS_TYPE3          = (3 << 8)
-STATUS_TYPE4          = (4 << 8)
-STATUS_P2P            = (8 << 8)
-
-STATUS_INITIATOR      = (1 << 16)
-STATUS_TARGET         = (0 << 16)
-
-CHUNK_SIZE = 40
-
-TEXT_ENCODING = {0: "utf-8", 1: "utf-16"}
+class FirmwareUpgradeRequiredException(Exception):
+    pass
 
-class SmartPosterNestingException(Exception):
+class StaleRecordException(Exception):
     pass
 
-class FirmwareUpgradeRequiredException(Exception):
+class UploadCancelledException(Exception):
     pass
 
 class MicroNFCBoard(object):
@@ -72,29 +67,131 @@ class MicroNFCBoard(object):
         self._transport = Transport()
         self._id = None
         self._version = None
-        self._polling = False
-        self._connected = False
-        self._type2 = False
-        self._type4 = False
-        self._p2p = False
-        self._initiator = False
-        self._ndefPresent = False
+        self._status = StatusSnapshot(0)
+        self._statusTime = None
+        self._statusTTL = 0
         self._ndefRecords = None
         self._ndefRead = False
-        self._ndefReadable = False
-        self._ndefWriteable = False
-        self._ndefBusy = False
-        self._ndefSuccess = False
+        self._generation = 0 #Incremented whenever the message held by the board changes
+        self._lazy = False
+        self._localPrefixes = True
+        self._events = EventDispatcher(self)
+        self._poller = None
+        self._lazyParsers = {   0 : self._parseUnknownRecord,
+                                1 : self._parseLazyURIRecord,
+                                2 : self._parseLazyTextRecord,
+                                3 : self._parseLazySmartPosterRecord,
+                                4 : self._parseLazyMIMERecord,
+                            }
+        self._readChunkSize = CHUNK_SIZE
+        self._writeChunkSize = CHUNK_SIZE
+        self._chunkSizesKey = None #Board id and firmware version the chunk sizes were negotiated with
+        self._compiler = MessageCompiler(CHUNK_SIZE, self._encodePrefix)
+        self._stagedDigest = None #Digest of the message staged on the board, if known
+        self._emulating = False
         
     def open(self):
+        self.invalidateStagedMessage()
+        self._generation += 1
         self._transport.open(self._intf)
         version, revision, self._id = self._transport.info()
         self._version = (version, revision)
         if( self._version < TARGET_FIRMWARE ):
             #self._transport.reset(True)
             raise FirmwareUpgradeRequiredException("Your current firmware (version %d.%d) is outdated; please upgrade it to version %d.%d" % (version, revision, TARGET_FIRMWARE[0], TARGET_FIRMWARE[1]))
+        self._localPrefixes = self._checkPrefixes()
+        if self._chunkSizesKey != (self._id, self._version):
+            self._chunkSizesKey = None
+            self._setChunkSizes(CHUNK_SIZE, CHUNK_SIZE)
+        
+    def negotiateChunkSizes(self):
+        """
+        Find the largest record data chunks the firmware transfers intact in each direction,
+        keeping them until the board is opened with a different firmware; returns (read, write) sizes
+        This stages a test message, replacing the one held by the board, so it can only be done while not emulating
+        """
+        if self._emulating:
+            raise BoardError("Cannot negotiate chunk sizes while emulating")
+        self.invalidateStagedMessage()
+        self._generation += 1
+        self._ndefRecords = None
+        self._ndefRead = False
+        try:
+            readChunkSize, writeChunkSize = self._probeChunkSizes()
+        except BoardError:
+            logging.warning("Could not negotiate chunk sizes, using %d bytes chunks", CHUNK_SIZE)
+            readChunkSize, writeChunkSize = CHUNK_SIZE, CHUNK_SIZE
+        self._setChunkSizes(readChunkSize, writeChunkSize)
+        self._chunkSizesKey = (self._id, self._version)
+        self._statusChanged()
+        return readChunkSize, writeChunkSize
+        
+    def _setChunkSizes(self, readChunkSize, writeChunkSize):
+        self._readChunkSize = readChunkSize
+        self._writeChunkSize = writeChunkSize
+        self._compiler = MessageCompiler(writeChunkSize, self._encodePrefix)
+        
+    def _probeChunkSizes(self):
+        #Stage a one record message holding a known pattern written in safe chunks, then only accept
+        #the sizes whose transfers round-trip: large reads of the pattern, large writes read back in safe chunks
+        length = max(READ_CHUNK_SIZES + WRITE_CHUNK_SIZES)
+        pattern = bytearray((i * 7 + 1) & 0xFF for i in range(length))
+        try:
+            self._transport.executeBatch([('NFC_PREPARE_MESSAGE', True, False), ('NFC_SET_RECORD_INFO', 0, 4, [0, length]),
+                                          ('NFC_SET_MESSAGE_INFO', 1), ('NFC_PREPARE_MESSAGE', False, True)])
+            self._writeProbeData(pattern, CHUNK_SIZE)
+            readChunkSize = self._probeChunkSize(READ_CHUNK_SIZES, lambda size: self._readProbeData(size, size) == pattern[:size])
+            def roundTrip(size):
+                data = bytearray(0xFF - b for b in pattern[:size])
+                self._writeProbeData(data, size)
+                return self._readProbeData(size, CHUNK_SIZE) == data
+            writeChunkSize = self._probeChunkSize(WRITE_CHUNK_SIZES, roundTrip)
+        finally:
+            #Leave an empty message rather than the test one
+            self._transport.executeBatch([('NFC_PREPARE_MESSAGE', True, False), ('NFC_SET_MESSAGE_INFO', 0), ('NFC_PREPARE_MESSAGE', False, True)])
+        return readChunkSize, writeChunkSize
+    
+    def _writeProbeData(self, data, chunkSize):
+        #Flush so that the status of the posted commands is checked now
+        for off in range(0, len(data), chunkSize):
+            self._transport.nfcSetRecordData(0, 1, off, data[off:off+chunkSize])
+        self._transport.flush()
+        
+    def _readProbeData(self, length, chunkSize):
+        data = bytearray()
+        for off in range(0, length, chunkSize):
+            data += self._transport.nfcGetRecordData(0, 1, off, min(chunkSize, length - off))
+        return data
+        
+    def _probeChunkSize(self, sizes, roundTrip):
+        #Returns the first size whose transfer is accepted and intact, falling back to the last, safe one
+        for size in sizes[:-1]:
+            try:
+                if roundTrip(size):
+                    return size
+                logging.warning("%d bytes record data chunks are corrupted by the firmware", size)
+            except BoardError:
+                pass
+        return sizes[-1]
+        
+    def _checkPrefixes(self):
+        #The local URI prefix table is only used if it matches the firmware's
+        codes = range(len(uri.URI_PREFIXES))
+        try:
+            prefixes = self._transport.executeBatch([('NFC_DECODE_PREFIX', code) for code in codes])
+        except BoardError:
+            logging.warning("Could not read the firmware URI prefixes, using remote prefix encoding")
+            return False
+        for code, prefix in zip(codes, prefixes):
+            if prefix.tobytes() != uri.URI_PREFIXES[code]:
+                logging.warning("Firmware URI prefix %d differs from the local table, using remote prefix encoding", code)
+                return False
+        return True
         
     def close(self):
+        self.stopEvents()
+        self.invalidateStagedMessage()
+        self._generation += 1
         self._transport.close()
         
     @property
@@ -103,305 +200,409 @@ class MicroNFCBoard(object):
     
     @property
     def connected(self):
-        self._updateStatus()
-        return self._connected
+        return self._updateStatus().connected
 
     @property
     def type2Tag(self):
-        self._updateStatus()
-        return self._type2 and self._initiator
+        return self._updateStatus().type2Tag
     
     @property
     def type4Emulator(self):
-        self._updateStatus()
-        return self._type4 and not self._initiator
+        return self._updateStatus().type4Emulator
     
     @property
     def p2p(self):
-        self._updateStatus()
-        return self._p2p
+        return self._updateStatus().p2p
 
     @property
     def polling(self):
-        self._updateStatus()
-        return self._polling
+        return self._updateStatus().polling
     
     @property
     def ndefReadable(self):
-        self._updateStatus()
-        return self._ndefReadable
+        return self._updateStatus().ndefReadable
     
     @property
     def ndefWriteable(self):
-        self._updateStatus()
-        return self._ndefWriteable
+        return self._updateStatus().ndefWriteable
     
     @property
     def ndefPresent(self):
-        self._updateStatus()
-        return self._ndefPresent
+        return self._updateStatus().ndefPresent
     
     @property
     def ndefBusy(self):
-        self._updateStatus()
-        return self._ndefBusy
+        return self._updateStatus().ndefBusy
     
     @property
     def ndefSuccess(self):
-        self._updateStatus()
-        return self._ndefSuccess
+        return self._updateStatus().ndefSuccess
     
     @property
     def ndefRecords(self):
-        self._updateStatus()
-        if self._ndefPresent and not self._ndefRead:
+        if self._updateStatus().ndefPresent and not self._ndefRead:
             self._ndefRecords = self._getNdefMessageRecords()
             self._ndefRead = True
         return self._ndefRecords
     
     @ndefRecords.setter
     def ndefRecords(self, records):
-        self._updateStatus()
-        self._ndefRecords = records
-        #Push them to device
-        self._setNdefRecords(self._ndefRecords)
+        """
+        Push a list of records, or a CompiledMessage, to the device
+        """
+        self.stageMessage(records)
     
     @property
     def version(self):
         return self._version
     
+    def stageMessage(self, records, progress = None, cancel = None):
+        """
+        Upload a list of records, or a CompiledMessage, to the device, ready for ndefWrite() or emulation
+        The upload is skipped if the board still holds the same message
+        progress(done, total) is called with the number of data bytes sent after each batch of chunks;
+        the upload is abandoned with an UploadCancelledException once cancel (such as a threading.Event) is set
+        """
+        self._updateStatus()
+        message, upload = self._planUpload(records)
+        if upload:
+            self._writeCompiledMessage(message, progress, cancel)
+        self._statusChanged()
+        
+    def _planUpload(self, records):
+        #Returns the CompiledMessage to stage and whether it has to be uploaded
+        if isinstance(records, CompiledMessage) and (records.chunkSize > self._writeChunkSize):
+            records = records.records #Compiled for a board accepting larger chunks
+        if not isinstance(records, CompiledMessage):
+            records = self.compileMessage(records)
+        self._ndefRecords = records.records
+        return records, self._emulating or (records.digest != self._stagedDigest)
+        
+    def compileMessage(self, records):
+        """
+        Compile records once into a CompiledMessage that can then be assigned to ndefRecords of several tags
+        """
+        return self._compiler.compile(records)
+    
+    def setLazyRecords(self, lazy):
+        """
+        In lazy mode, reading ndefRecords only fetches the records information;
+        their content is fetched on first access and a StaleRecordException is raised
+        if the message has been replaced or the tag disconnected in the meantime
+        """
+        self._lazy = lazy
+        self._ndefRead = False
+    
+    def invalidateStagedMessage(self):
+        """
+        Forget the message staged on the board so that the next write of ndefRecords uploads it again
+        """
+        self._stagedDigest = None
+    
+    def snapshot(self):
+        """
+        Returns a StatusSnapshot decoded from a single GET_STATUS
+        """
+        self._statusTime = None
+        return self._updateStatus()
+    
+    def setStatusTTL(self, ttl):
+        """
+        Let properties reuse the last status word for up to ttl seconds (0 to always poll)
+        """
+        self._statusTTL = ttl
+        self._statusTime = None
+    
+    def addEventListener(self, listener):
+        """
+        Register a callable or a queue receiving the events.Event instances emitted in event mode
+        """
+        return self._events.addListener(listener)
+    
+    def removeEventListener(self, listener):
+        self._events.removeListener(listener)
+    
+    def startEvents(self, fastInterval = FAST_INTERVAL, slowInterval = SLOW_INTERVAL):
+        """
+        Start event mode: a background thread polls the status and emits events on changes
+        """
+        if self._poller != None:
+            return
+        self._events.reset()
+        self._poller = StatusPoller(self, self._events, fastInterval, slowInterval)
+        self._poller.start()
+        
+    def stopEvents(self):
+        poller = self._poller
+        self._poller = None
+        if poller != None:
+            poller.stop()
+            
+    def _pollerStopped(self, poller):
+        #Lets startEvents() start a new poller once this one has exited on its own
+        if self._poller is poller:
+            self._poller = None
+    
+    def _statusChanged(self):
+        self._statusTime = None
+        if self._poller != None:
+            self._poller.wake()
+    
     def getNfcInfo(self):
         return self._transport.nfcGetInfo()
     
     def reset(self):
+        self.invalidateStagedMessage()
+        self._generation += 1
+        self._emulating = False
         self._transport.reset(False)
+        self._statusChanged()
         
     def startPolling(self, readerWriter, emulator, p2p):
+        self._setEmulating(emulator or p2p)
         self._transport.nfcPoll(readerWriter, emulator, p2p)
+        self._statusChanged()
         
     def stopPolling(self):
+        self._setEmulating(False)
         self._transport.nfcPoll(False, False, False)
+        self._statusChanged()
+        
+    def _setEmulating(self, emulating):
+        #An emulated tag or a peer can rewrite the message at any time
+        if emulating or self._emulating:
+            self.invalidateStagedMessage()
+        self._emulating = emulating
         
     def ndefRead(self):
+        self._readStarted()
         self._transport.nfcOperation(True, False)
+        self._statusChanged()
+        
+    def _readStarted(self):
+        #The message read replaces the staged one
+        self.invalidateStagedMessage()
+        self._generation += 1
+        self._ndefRead = False
         
     def ndefWrite(self):
-        self._transport.nfcOperation(False, True)
+        #The write is marked pending under the transport lock, before the operation is sent
+        try:
+            self._transport.execute('NFC_OPERATION', (False, True), self._events.writeStarted)
+        except:
+            self._events.writeAborted()
+            raise
+        self._statusChanged()
+        
+    def iterRecordChunks(self, recordNumber, item, itemLength = None):
+        """
+        Generator yielding the content of a record item as memoryviews of up to the negotiated chunk size
+        Chunks are requested in pipelined batches of STREAM_BATCH
+        """
+        if itemLength == None:
+            itemLength = self._getItemLength(recordNumber, item)
+        chunkSize = self._readChunkSize
+        batchLength = STREAM_BATCH * chunkSize
+        for batchOff in range(0, itemLength, batchLength):
+            batchEnd = min(batchOff + batchLength, itemLength)
+            for chunk in self._transport.executeBatch([('NFC_GET_RECORD_DATA', recordNumber, item, itemOff, min(chunkSize, batchEnd - itemOff))
+                                                        for itemOff in range(batchOff, batchEnd, chunkSize)]):
+                yield chunk
+                
+    def readRecordInto(self, recordNumber, item, dest, progress = None, itemLength = None):
+        """
+        Stream a record item into dest, either a writable buffer (bytearray, memoryview, mmap) filled from its start
+        or a file object written at its current position; progress(done, total) is called after each chunk
+        Returns the item length
+        """
+        if itemLength == None:
+            itemLength = self._getItemLength(recordNumber, item)
+        store = _sink(dest, itemLength)
+        itemOff = 0
+        for chunk in self.iterRecordChunks(recordNumber, item, itemLength):
+            store(itemOff, chunk)
+            itemOff += len(chunk)
+            if progress != None:
+                progress(itemOff, itemLength)
+        return itemLength
         
     def setLeds(self, led1, led2):
         self._transport.leds(led1, led2)
         
+    def enableStats(self, enabled = True):
+        """
+        Start or stop collecting per command calls, errors and latency statistics
+        """
+        self._transport.enableStats(enabled)
+        
+    def stats(self):
+        """
+        Returns a dict with the totals and, under 'commands', per command name calls, errors by kind,
+        bytes in and out and p50/p99/max latencies in seconds; None if stats are not enabled
+        """
+        return self._transport.stats()
+    
+    def resetStats(self):
+        self._transport.resetStats()
+        
+    def setPipelineWindow(self, window):
+        #Only effective with firmware supporting pipelined commands, at most transport.MAX_WINDOW
+        self._transport.setWindow(window)
+        
+    def setTimeout(self, timeout):
+        """
+        Fail commands with a transport.TimeoutError if the board does not respond within timeout seconds (None to wait forever)
+        """
+        self._transport.setTimeout(timeout)
+        
+    def deadline(self, timeout):
+        """
+        Context manager bounding the operations of the calling thread to timeout seconds overall:
+            with board.deadline(0.5):
+                records = board.ndefRecords
+        """
+        return self._transport.deadline(timeout)
+        
     def _updateStatus(self):
+        if (self._statusTime != None) and (time() - self._statusTime < self._statusTTL):
+            return self._status
         status = self._transport.status()
-        self._polling = (status & STATUS_POLLING) != 0
-        self._connected = (status & STATUS_CONNECTED) != 0
-        self._ndefPresent = (status & STATUS_NDEF_PRESENT) != 0
-        self._ndefReadable = (status & STATUS_NDEF_READABLE) != 0
-        self._ndefWriteable = (status & STATUS_NDEF_WRITEABLE) != 0
-        self._ndefBusy = (status & STATUS_NDEF_BUSY) != 0
-        self._ndefSuccess = (status & STATUS_NDEF_SUCCESS) != 0
-        self._type2 = (status & STATUS_TYPE_MASK) == STATUS_TYPE2
-        self._type4 = (status & STATUS_TYPE_MASK) == STATUS_TYPE4
-        self._p2p = (status & STATUS_TYPE_MASK) == STATUS_P2P
-        self._initiator = (status & STATUS_INITIATOR) != 0
+        if self._statusTTL > 0:
+            self._statusTime = time()
+        return self._setStatus(status)
         
-        if not self._ndefPresent:
+    def _setStatus(self, status):
+        if status != self._status.status: #Snapshots are immutable, reuse the current one
+            if self._status.ndefPresent and not (status & STATUS_NDEF_PRESENT):
+                self._generation += 1
+            self._status = StatusSnapshot(status)
+        
+        if not self._status.ndefPresent:
             self._ndefRead = False
             self._ndefRecords = None
+        return self._status
         
     def _getNdefRecords(self, start, count):
+        #Lazy records, their content being fetched on first access
         records = []
-        for recordNumber in range(start, start+count):
-            #Get records info
-            recordType, recordInfo = self._transport.nfcGetRecordInfo(recordNumber)
-            funcs = {   0 : self._parseUnknownRecord,
-                        1 : self._parseURIRecord,
-                        2 : self._parseTextRecord,
-                        3 : self._parseSmartPosterRecord,
-                        4 : self._parseMIMERecord,
-                    }
-            record = funcs[recordType](recordNumber, recordInfo)
+        recordsInfo = self._transport.executeBatch([('NFC_GET_RECORD_INFO', recordNumber) for recordNumber in range(start, start+count)])
+        for recordNumber, (recordType, recordInfo) in zip(range(start, start+count), recordsInfo):
+            record = self._lazyParsers[recordType](recordNumber, recordInfo)
             if record != None:
                 records += [record]
         return records
     
-    def _getNdefMessageRecords(self):    
-        #Get message count
-        recordsCount = self._transport.nfcGetMessageInfo()
-        return self._getNdefRecords(0, recordsCount)
+    def _getNdefMessageRecords(self):
+        if self._lazy:
+            return self._getNdefRecords(0, self._transport.nfcGetMessageInfo())
+        reader = self._messageReader()
+        self._runBatches(reader.run())
+        return reader.records
+    
+    def _messageReader(self):
+        #Shared with the reactor, which runs the batches of reader.run() itself
+        return MessageReader(self._readChunkSize, STREAM_BATCH, self._localPrefixes)
+    
+    def _runBatches(self, batches):
+        #Run each batch of command descriptors yielded by a generator, sending it back their results
+        results = None
+        while True:
+            try:
+                batch = batches.send(results)
+            except StopIteration:
+                return
+            results = self._transport.executeBatch(batch)
     
     def _parseUnknownRecord(self, recordNumber, recordInfo):
         return None
     
-    def _parseURIRecord(self, recordNumber, recordInfo):
-        uriPrefix = recordInfo[0]
-        uriLength = recordInfo[1]
-        uri = unicode(self._decodePrefix(uriPrefix).tostring() + self._getRecordData(recordNumber, 0, uriLength).tostring(), "utf-8")
-        return URIRecord(uri)
-    
-    def _parseTextRecord(self, recordNumber, recordInfo):
-        encoding = TEXT_ENCODING[recordInfo[0]]
-        languageCodeLength = recordInfo[1]
-        textLength = recordInfo[2]
-        languageCode = unicode(self._getRecordData(recordNumber, 0, languageCodeLength).tostring(), "utf-8")
-        text = unicode(self._getRecordData(recordNumber, 1, textLength).tostring(), encoding)
-        return TextRecord(text, languageCode, encoding)
-    
-    def _parseSmartPosterRecord(self, recordNumber, recordInfo):
-        recordsStart = recordInfo[0]
-        recordsCount = recordInfo[1]
-        records = self._getNdefRecords(recordsStart, recordsCount)
-        return SmartPosterRecord(records)
-    
-    def _parseMIMERecord(self, recordNumber, recordInfo):
-        mimeTypeLength = recordInfo[0]
-        dataLength = recordInfo[1]
-        mimeType = unicode(self._getRecordData(recordNumber, 0, mimeTypeLength).tostring(), "utf-8")
-        data = self._getRecordData(recordNumber, 1, dataLength)
-        return MIMERecord(mimeType, data)
+    def _checkGeneration(self, generation):
+        if (self._updateStatus().ndefPresent) and (generation == self._generation):
+            return
+        raise StaleRecordException("The message this record belongs to is no longer available")
+    
+    def _lazyFetch(self, recordNumber):
+        generation = self._generation
+        def fetch(item, itemLength):
+            self._checkGeneration(generation)
+            return self._getRecordData(recordNumber, item, itemLength)
+        return fetch
+    
+    def _parseLazyURIRecord(self, recordNumber, recordInfo):
+        return LazyURIRecord(self._lazyFetch(recordNumber), self._decodePrefix, recordInfo)
+    
+    def _parseLazyTextRecord(self, recordNumber, recordInfo):
+        return LazyTextRecord(self._lazyFetch(recordNumber), recordInfo, TEXT_ENCODING[recordInfo[0]])
+    
+    def _parseLazySmartPosterRecord(self, recordNumber, recordInfo):
+        generation = self._generation
+        def fetchRecords():
+            self._checkGeneration(generation)
+            return self._getNdefRecords(recordInfo[0], recordInfo[1])
+        return LazySmartPosterRecord(fetchRecords)
+    
+    def _parseLazyMIMERecord(self, recordNumber, recordInfo):
+        return LazyMIMERecord(self._lazyFetch(recordNumber), recordInfo)
     
     def _decodePrefix(self, prefix):
-        return self._transport.nfcDecodePrefix(prefix)
+        if self._localPrefixes:
+            return uri.decodePrefix(prefix)
+        return bytes(self._transport.nfcDecodePrefix(prefix))
     
     def _getRecordData(self, recordNumber, item, itemLength):
-        buf = array("B")
-        while len(buf) < itemLength:
-            chunkLength = min(CHUNK_SIZE, itemLength - len(buf))
-            buf += self._transport.nfcGetRecordData(recordNumber, item, len(buf), chunkLength)
+        buf = bytearray(itemLength)
+        self.readRecordInto(recordNumber, item, buf, itemLength = itemLength)
         return buf
     
-    def _setNdefRecords(self, records):
-        self._transport.nfcPrepareMessage(True, False)
-        recordNumber = 0
-        spRecordNumber = len(records) #Smart poster records after main records
-        for record in records:
-            spRecordNumber = self._addNdefRecord(recordNumber, record, spRecordNumber)
-            recordNumber += 1
-        self._transport.nfcSetMessageInfo(recordNumber)
-        self._transport.nfcPrepareMessage(False, True)
-        recordNumber = 0
-        spRecordNumber = len(records) 
-        for record in records:
-            spRecordNumber = self._setNdefRecord(recordNumber, record, spRecordNumber)
-            recordNumber += 1
-        #self._transport.nfcSetMessageInfo(recordNumber)
-        
-    def _addNdefRecord(self, recordNumber, record, recordsStart, spAllowed = True):
-        funcs = {   URIRecord : self._generateURIRecord,
-                    TextRecord : self._generateTextRecord,
-                    SmartPosterRecord : self._generateSmartPosterRecord,
-                    MIMERecord : self._generateMIMERecord,
-                }
-        
-        if( not spAllowed and type(record) == SmartPosterRecord ):
-            raise SmartPosterNestingException()
-                
-        return funcs[type(record)](recordNumber, record, recordsStart)
-        
-    def _generateURIRecord(self, recordNumber, record, spRecordNumber):
-        #Try to get prefix
-        buf = array("B")
-        buf.fromstring(record.uri)
-        prefix, length = self._encodePrefix(buf[0:36])
-        
-        self._transport.nfcSetRecordInfo(recordNumber, 1, [prefix, len(buf[length:])])
-        
-        return spRecordNumber
-        
-    def _generateTextRecord(self, recordNumber, record, spRecordNumber):
-        languageCodeBuf = array("B")
-        languageCodeBuf.fromstring(record.language)
-       
-        textBuf = array("B")
-        textBuf.fromstring(record.text)
-        
-        self._transport.nfcSetRecordInfo(recordNumber, 2, [{v: k for k, v in TEXT_ENCODING.items()}[record.encoding], len(languageCodeBuf), len(textBuf)])
-        
-        return spRecordNumber
-        
-    def _generateSmartPosterRecord(self, recordNumber, record, recordsStart):
-        self._transport.nfcSetRecordInfo(recordNumber, 3, [recordsStart, len(record.records)])
-        spRecordNumber = recordsStart
-        
-        for spRecord in record.records:
-            self._addNdefRecord(spRecordNumber, spRecord, 0, False) #No sub records
-            spRecordNumber += 1
-            
-        return spRecordNumber
-    
-    def _generateMIMERecord(self, recordNumber, record, spRecordNumber):
-        mimeTypeBuf = array("B")
-        mimeTypeBuf.fromstring(record.mimeType)
-       
-        dataBuf = array("B", record.data)
-        
-        self._transport.nfcSetRecordInfo(recordNumber, 4, [len(mimeTypeBuf), len(dataBuf)])
-        
-        return spRecordNumber
-    
-    def _setNdefRecord(self, recordNumber, record, recordsStart, spAllowed = True):
-        funcs = {   URIRecord : self._setURIRecord,
-                    TextRecord : self._setTextRecord,
-                    SmartPosterRecord : self._setSmartPosterRecord,
-                    MIMERecord : self._setMIMERecord,
-                }
-        
-        if( not spAllowed and type(record) == SmartPosterRecord ):
-            raise SmartPosterNestingException()
-                
-        return funcs[type(record)](recordNumber, record, recordsStart)
-        
-    def _setURIRecord(self, recordNumber, record, spRecordNumber):
-        #Try to get prefix
-        buf = array("B")
-        buf.fromstring(record.uri)
-        prefix, length = self._encodePrefix(buf[0:36])
-        
-        self._setRecordData(recordNumber, 0, buf[length:])
-        
-        return spRecordNumber
-        
-    def _setTextRecord(self, recordNumber, record, spRecordNumber):
-        languageCodeBuf = array("B")
-        languageCodeBuf.fromstring(record.language)
-       
-        textBuf = array("B")
-        textBuf.fromstring(record.text)
-        
-        self._setRecordData(recordNumber, 0, languageCodeBuf)
-        self._setRecordData(recordNumber, 1, textBuf)
-        
-        return spRecordNumber
-        
-    def _setSmartPosterRecord(self, recordNumber, record, recordsStart):
-        spRecordNumber = recordsStart
-        
-        for spRecord in record.records:
-            self._setNdefRecord(spRecordNumber, spRecord, 0, False) #No sub records
-            spRecordNumber += 1
-            
-        return spRecordNumber
+    def _getItemLength(self, recordNumber, item):
+        recordType, recordInfo = self._transport.nfcGetRecordInfo(recordNumber)
+        fields = ITEM_LENGTH_FIELDS.get(recordType, ())
+        if item >= len(fields):
+            raise ValueError("Record %d has no item %d" % (recordNumber, item))
+        return recordInfo[fields[item]]
     
-    def _setMIMERecord(self, recordNumber, record, spRecordNumber):
-        mimeTypeBuf = array("B")
-        mimeTypeBuf.fromstring(record.mimeType)
-       
-        dataBuf = array("B", record.data)
-        
-        self._setRecordData(recordNumber, 0, mimeTypeBuf)
-        self._setRecordData(recordNumber, 1, dataBuf)
-        
-        return spRecordNumber
-
-    def _encodePrefix(self, uri):
-        prefix, length = self._transport.nfcEncodePrefix(uri)
+    def _writeCompiledMessage(self, message, progress = None, cancel = None):
+        #Reports are built one batch at a time, chunks being copied straight from the payload views
+        for batch in self._uploadBatches(message, progress, cancel):
+            self._transport.executeBatch(batch)
+        
+    def _uploadBatches(self, message, progress = None, cancel = None):
+        #Yields the batches of commands uploading message, shared with the reactor: each batch must
+        #have been run before the next one is requested, and the message is staged once all have
+        self._stagedDigest = None #Until the upload completes the board holds a partial message
+        self._generation += 1
+        commands = message.commands
+        done = 0
+        for start in range(0, len(commands), STREAM_BATCH):
+            if (cancel != None) and cancel.is_set():
+                raise UploadCancelledException()
+            batch = commands[start:start+STREAM_BATCH]
+            yield batch
+            if progress != None:
+                done += sum([len(command[4]) for command in batch if command[0] == 'NFC_SET_RECORD_DATA'])
+                progress(done, message.dataLength)
+        self._stagedDigest = message.digest
+        
+    def _encodePrefix(self, uriData):
+        if self._localPrefixes:
+            return uri.encodePrefix(uriData)
+        prefix, length = self._transport.nfcEncodePrefix(uriData[0:36])
         return prefix, length
-    
-    def _setRecordData(self, recordNumber, item, itemData):
-        itemLength = len(itemData)
-        itemOff = 0
-        while itemOff < itemLength:
-            chunkLength = min(CHUNK_SIZE, itemLength - itemOff)
-            buf = array("B", itemData[itemOff:itemOff+chunkLength])
-            self._transport.nfcSetRecordData(recordNumber, item, itemOff, buf)
-            itemOff += chunkLength
+
+def _sink(dest, length):
+    #Returns a function storing a chunk at a given offset of dest
+    if hasattr(dest, "write") and not isinstance(dest, mmap):
+        return lambda off, chunk: dest.write(chunk)
+    try:
+        view = memoryview(dest)
+    except TypeError: #mmap has no buffer interface on Python 2
+        view = None
+    if len(dest) < length:
+        raise ValueError("Destination too small (%d bytes, %d needed)" % (len(dest), length))
+    if view == None:
+        def store(off, chunk):
+            dest[off:off+len(chunk)] = chunk.tobytes()
+        return store
+    def store(off, chunk):
+        view[off:off+len(chunk)] = chunk
+    return store
@@ -0,0 +1,237 @@
+"""
+MicroNFCBoard Python API
+
+Copyright (c) 2014-2015 AppNearMe Ltd
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from threading import Thread, Event as _ThreadEvent, Lock, current_thread
+import logging
+
+from status import StatusSnapshot
+from transport import BoardError
+
+# Status polling periods (in seconds) while a tag is present or an operation is busy, and while idle
+FAST_INTERVAL = 0.01
+SLOW_INTERVAL = 0.1
+# Longest period between polls retried after transport errors
+MAX_BACKOFF = 1.0
+
+class Event(object):
+    """
+    Base class of the events emitted by a MicroNFCBoard
+    """
+    def __init__(self, board, snapshot):
+        self._board = board
+        self._snapshot = snapshot
+    
+    @property
+    def board(self):
+        return self._board
+    
+    @property
+    def snapshot(self):
+        return self._snapshot
+    
+    def __str__(self):
+        return "%s (%r)" % (self.__class__.__name__, self._snapshot)
+
+class PollingStartedEvent(Event):
+    pass
+
+class PollingStoppedEvent(Event):
+    pass
+
+class ConnectedEvent(Event):
+    pass
+
+class NdefReadableEvent(Event):
+    pass
+
+class NdefPresentEvent(Event):
+    pass
+
+class WriteSuccessEvent(Event):
+    pass
+
+class WriteFailureEvent(Event):
+    pass
+
+class DisconnectedEvent(Event):
+    pass
+
+class ErrorEvent(Event):
+    """
+    Status polling failed; polling goes on after transport errors, and stops after any other error
+    """
+    def __init__(self, board, snapshot, error):
+        super(ErrorEvent, self).__init__(board, snapshot)
+        self._error = error
+    
+    @property
+    def error(self):
+        return self._error
+    
+    def __str__(self):
+        return "%s (%r, %s)" % (self.__class__.__name__, self._snapshot, self._error)
+
+class EventDispatcher(object):
+    """
+    Diffs successive status snapshots of a board and emits the corresponding events
+    to listeners, which are callables or queues (anything with a put() method)
+    """
+    def __init__(self, board):
+        self._board = board
+        self._listeners = []
+        self._lock = Lock()
+        self._previous = None
+        self._writePending = False
+        self._writeToken = 0 #Incremented when a write starts
+    
+    def addListener(self, listener):
+        if hasattr(listener, "put"):
+            listener = listener.put
+        with self._lock:
+            self._listeners = self._listeners + [listener]
+        return listener
+    
+    def removeListener(self, listener):
+        with self._lock:
+            self._listeners = [l for l in self._listeners if (l != listener) and (getattr(listener, "put", None) != l)]
+    
+    def writeStarted(self):
+        """
+        Called before the write operation is sent, so that snapshots taken from then on report its outcome
+        """
+        self._writeToken += 1
+        self._writePending = True
+        
+    def writeAborted(self):
+        self._writePending = False
+        
+    def token(self):
+        """
+        Returns the token to pass to update() with a snapshot taken after this call
+        """
+        return self._writeToken
+        
+    def reset(self):
+        self._previous = None
+        self._writePending = False
+    
+    def update(self, snapshot, token = None):
+        """
+        Emits the events between the previous snapshot and this one
+        A snapshot whose token predates the last writeStarted() does not end the write
+        """
+        writeDone = self._writePending and ((token == None) or (token == self._writeToken))
+        previous = self._previous
+        self._previous = snapshot
+        if (previous is snapshot) and not writeDone:
+            return
+        if previous == None:
+            previous = StatusSnapshot(0)
+        
+        events = []
+        if snapshot.polling and not previous.polling:
+            events.append(PollingStartedEvent)
+        if previous.polling and not snapshot.polling:
+            events.append(PollingStoppedEvent)
+        if snapshot.connected and not previous.connected:
+            events.append(ConnectedEvent)
+        if snapshot.ndefReadable and not previous.ndefReadable:
+            events.append(NdefReadableEvent)
+        if snapshot.ndefPresent and not previous.ndefPresent:
+            events.append(NdefPresentEvent)
+        if writeDone and not snapshot.ndefBusy:
+            self._writePending = False
+            events.append(WriteSuccessEvent if snapshot.ndefSuccess else WriteFailureEvent)
+        if previous.connected and not snapshot.connected:
+            events.append(DisconnectedEvent)
+        
+        for eventClass in events:
+            self.emit(eventClass(self._board, snapshot))
+            
+    def emit(self, event):
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception:
+                logging.exception("Event listener failed")
+                
+    def error(self, error):
+        self.emit(ErrorEvent(self._board, self._previous if self._previous != None else StatusSnapshot(0), error))
+
+class StatusPoller(Thread):
+    """
+    Background thread polling GET_STATUS on a board: every fastInterval seconds while
+    a tag is connected or an operation is busy, every slowInterval seconds otherwise
+    """
+    def __init__(self, board, dispatcher, fastInterval = FAST_INTERVAL, slowInterval = SLOW_INTERVAL):
+        super(StatusPoller, self).__init__(name = "MicroNFCBoard status poller")
+        self.daemon = True
+        self._board = board
+        self._dispatcher = dispatcher
+        self._fastInterval = fastInterval
+        self._slowInterval = slowInterval
+        self._stopEvent = _ThreadEvent()
+        self._wakeEvent = _ThreadEvent()
+        
+    def wake(self):
+        """
+        Poll now, after a command that changes the status
+        """
+        self._wakeEvent.set()
+        
+    def stop(self):
+        self._stopEvent.set()
+        self._wakeEvent.set()
+        if self is not current_thread():
+            self.join()
+    
+    def run(self):
+        try:
+            self._poll()
+        finally:
+            self._board._pollerStopped(self)
+            
+    def _poll(self):
+        backoff = None
+        while not self._stopEvent.is_set():
+            token = self._dispatcher.token()
+            try:
+                snapshot = self._board.snapshot()
+            except (BoardError, IOError) as e:
+                #Transport errors (such as a timeout) may not last: retry, less and less often
+                if backoff == None:
+                    logging.warning("Status polling failed: %s", e)
+                    self._dispatcher.error(e)
+                    backoff = max(self._fastInterval, FAST_INTERVAL)
+                else:
+                    backoff = min(backoff * 2, MAX_BACKOFF)
+                self._wakeEvent.wait(backoff)
+                self._wakeEvent.clear()
+                continue
+            except Exception as e:
+                logging.exception("Status polling failed")
+                self._dispatcher.error(e)
+                break
+            backoff = None
+            self._dispatcher.update(snapshot, token)
+            if snapshot.connected or snapshot.ndefBusy:
+                interval = self._fastInterval
+            else:
+                interval = self._slowInterval
+            self._wakeEvent.wait(interval)
+            self._wakeEvent.clear()
@@ -20,11 +20,15 @@ import logging
 from hidapi_backend import HidApiUSB
 from pyusb_backend import PyUSB
 from pywinusb_backend import PyWinUSB
+from hidraw_backend import HidRawUSB
+from simulator_backend import SimulatorUSB
 
 INTERFACE = {
              'hidapiusb': HidApiUSB,
              'pyusb': PyUSB,
-             'pywinusb': PyWinUSB
+             'pywinusb': PyWinUSB,
+             'hidraw': HidRawUSB,
+             'simulator': SimulatorUSB
             }
 
 # Allow user to override backend with an environment variable.
@@ -44,9 +48,11 @@ if not usb_backend:
         elif PyWinUSB.isAvailable:
             usb_backend = "pywinusb"
     elif os.name == "posix":
-        # Select hidapi for OS X and pyUSB for Linux.
+        # Select hidapi for OS X, and hidraw (no kernel driver detach, pollable) or pyUSB for Linux.
         if os.uname()[0] == 'Darwin':
             usb_backend = "hidapiusb"
+        elif HidRawUSB.isAvailable:
+            usb_backend = "hidraw"
         else:
             usb_backend = "pyusb"
 
@@ -16,7 +16,7 @@
 """
 
 from interface import Interface
-import logging, os
+import errno, logging, os
 
 try:
     import hid
@@ -90,15 +90,26 @@ class HidApiUSB(Interface):
         for _ in range(64 - len(data)):
             data.append(0)
         #logging.debug("send: %s", data)
-        self.device.write([0] + data)
+        self.device.write([0] + list(data))
         return
 
+    def writeReport(self, report):
+        """
+        write a complete report (report ID included) without copying it
+        """
+        self.device.write(report)
+
 
     def read(self, timeout = -1):
         """
-        read data on the IN endpoint associated to the HID interface
+        read data on the IN endpoint associated to the HID interface, waiting at most timeout ms (forever if negative)
         """
-        return self.device.read(64)
+        if timeout < 0:
+            return self.device.read(64)
+        data = self.device.read(64, max(timeout, 1)) #A timeout of 0 would block
+        if len(data) == 0:
+            raise IOError(errno.ETIMEDOUT, "Timeout reading from the device")
+        return data
 
     def close(self):
         """
@@ -0,0 +1,169 @@
+"""
+MicroNFCBoard Python API
+
+Copyright (c) 2014-2015 AppNearMe Ltd
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from interface import Interface
+from timeit import default_timer
+import errno, io, logging, os, select, sys
+
+HIDRAW_SYSFS = "/sys/class/hidraw"
+REPORT_SIZE = 64
+
+isAvailable = sys.platform.startswith("linux") and os.path.isdir(HIDRAW_SYSFS)
+
+class HidRawUSB(Interface):
+    """
+    This class provides basic functions to access
+    a USB HID device through the Linux hidraw driver:
+        - write/read reports on /dev/hidrawN, waiting with epoll (or select)
+    Any file descriptor exchanging 65 bytes output reports (report ID first) and
+    64 bytes input reports, such as a socketpair or a pty, can stand in for a device
+    """
+    
+    isAvailable = isAvailable
+    
+    def __init__(self, fd = None, path = None):
+        super(HidRawUSB, self).__init__()
+        self.path = path
+        self.fd = fd
+        self._ownFd = False
+        self._file = None
+        self._poller = None
+        self._report = bytearray(REPORT_SIZE + 1)
+        self._partial = bytearray(REPORT_SIZE) #Start of a report whose read timed out
+        self._partialLength = 0
+        
+    @staticmethod
+    def getAllConnectedInterface(vid, pid):
+        """
+        returns all the connected devices which matches vid/pid, found under /sys/class/hidraw
+        returns an array of HidRawUSB (Interface) objects
+        """
+        boards = []
+        for name in sorted(os.listdir(HIDRAW_SYSFS)):
+            info = _readUevent(os.path.join(HIDRAW_SYSFS, name, "device", "uevent"))
+            if "HID_ID" not in info:
+                continue
+            bus, deviceVid, devicePid = [int(field, 16) for field in info["HID_ID"].split(":")]
+            if (deviceVid != vid) or (devicePid != pid):
+                continue
+            new_board = HidRawUSB(path = os.path.join("/dev", name))
+            new_board.vid = vid
+            new_board.pid = pid
+            new_board.product_name = info.get("HID_NAME", "")
+            boards.append(new_board)
+        if len(boards) == 0:
+            logging.debug("No device connected")
+        return boards
+    
+    def init(self):
+        if self.fd == None:
+            try:
+                self.fd = os.open(self.path, os.O_RDWR)
+            except OSError as e:
+                logging.error("Could not open %s (%s), check the permissions of the device", self.path, e.strerror)
+                raise
+            self._ownFd = True
+        self._file = io.FileIO(self.fd, "r", closefd = False)
+        self._partialLength = 0
+        if hasattr(select, "epoll"):
+            self._poller = select.epoll()
+            self._poller.register(self.fd, select.EPOLLIN)
+        
+    def fileno(self):
+        """
+        file descriptor that becomes readable when a report is available
+        """
+        return self.fd
+    
+    def write(self, data):
+        """
+        write data as an output report, prefixed with report ID 0
+        """
+        length = min(len(data), REPORT_SIZE)
+        self._report[1:1+length] = data[0:length]
+        self._report[1+length:] = bytearray(REPORT_SIZE - length)
+        self.writeReport(self._report)
+        
+    def writeReport(self, report):
+        """
+        write a complete report (report ID included) without copying it
+        """
+        os.write(self.fd, report)
+        
+    def read(self, timeout = -1):
+        """
+        read an input report, waiting at most timeout ms (forever if negative)
+        """
+        buf = bytearray(REPORT_SIZE)
+        self.readInto(buf, timeout)
+        return buf
+    
+    def readInto(self, buf, timeout = -1):
+        """
+        read an input report into buf, waiting at most timeout ms (forever if negative)
+        A report may arrive in pieces through a stream stand-in: the timeout covers the whole
+        report, and the pieces read when it expires are kept for the next call
+        """
+        view = memoryview(buf)
+        length = self._partialLength
+        if length > 0:
+            view[0:length] = self._partial[0:length]
+            self._partialLength = 0
+        deadline = default_timer() + timeout / 1000.0 if timeout >= 0 else None
+        while length < REPORT_SIZE:
+            if not self._wait(deadline):
+                self._partial[0:length] = view[0:length]
+                self._partialLength = length
+                raise IOError(errno.ETIMEDOUT, "Timeout reading from %s" % (self.path or "fd %d" % self.fd,))
+            count = self._file.readinto(view[length:REPORT_SIZE])
+            if not count:
+                raise IOError(errno.EIO, "Device disconnected")
+            length += count
+        return length
+    
+    def _wait(self, deadline):
+        if deadline == None:
+            return True #Blocking read
+        timeout = max(0, deadline - default_timer())
+        if self._poller != None:
+            return len(self._poller.poll(timeout)) > 0
+        return len(select.select([self.fd], [], [], timeout)[0]) > 0
+    
+    def close(self):
+        """
+        close the interface
+        """
+        logging.debug("closing interface")
+        if self._poller != None:
+            self._poller.close()
+            self._poller = None
+        if self._ownFd:
+            os.close(self.fd)
+            self.fd = None
+            self._ownFd = False
+
+def _readUevent(path):
+    info = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                key, _, value = line.strip().partition("=")
+                info[key] = value
+    except IOError:
+        pass
+    return info
@@ -29,10 +29,29 @@ class Interface(object):
     
     def write(self, data):
         return
+    
+    def writeReport(self, report):
+        """
+        write a complete output report: report ID followed by 64 bytes of data
+        """
+        self.write(report[1:])
         
     def read(self, size = -1, timeout = -1):
+        """
+        read a report, waiting at most timeout ms (forever if negative);
+        raises IOError with errno ETIMEDOUT when the timeout expires
+        """
         return
     
+    def readInto(self, buf, timeout = -1):
+        """
+        read a report into buf, returning its length
+        """
+        data = self.read(timeout = timeout)
+        length = len(data)
+        buf[0:length] = data
+        return length
+    
     def getInfo(self):
         return self.vendor_name + " " + \
                self.product_name + " (" + \
@@ -16,7 +16,7 @@
 """
 
 from interface import Interface
-import logging, os
+import errno, logging, os
 
 try:
     import usb.core
@@ -148,6 +148,16 @@ class PyUSB(Interface):
         if self.ep_in is None:
             raise ValueError('EP_IN endpoint is NULL')
         
-        data = self.ep_in.read(self.ep_in.wMaxPacketSize, timeout)
+        #libusb waits forever with a timeout of 0
+        if timeout < 0:
+            timeout = 0
+        elif timeout == 0:
+            timeout = 1
+        try:
+            data = self.ep_in.read(self.ep_in.wMaxPacketSize, timeout)
+        except usb.core.USBError as e:
+            if (e.errno == errno.ETIMEDOUT) or ("timeout" in str(e).lower()):
+                raise IOError(errno.ETIMEDOUT, "Timeout reading from the device")
+            raise
         #logging.debug('received: %s', data)
         return data
@@ -16,6 +16,7 @@
 """
 
 from interface import Interface
+from report_queue import ReportQueue
 import logging, os
 
 try:
@@ -42,14 +43,14 @@ class PyWinUSB(Interface):
         super(PyWinUSB, self).__init__()
         # Vendor page and usage_id = 2
         self.report = []
-        self.rcv_data = []
+        self.rcv_data = ReportQueue()
         self.device = None
         return
     
     # handler called when a report is received
     def rx_handler(self, data):
         #logging.debug("rcv: %s", data[1:])
-        self.rcv_data.append(data[1:])
+        self.rcv_data.put(data[1:])
     
     def open(self):
         self.device.set_raw_data_handler(self.rx_handler)
@@ -102,17 +103,21 @@ class PyWinUSB(Interface):
         for _ in range(64 - len(data)):
             data.append(0)
         #logging.debug("send: %s", data)
-        self.report.send([0] + data)
+        self.report.send([0] + list(data))
         return
+    
+    def writeReport(self, report):
+        """
+        write a complete report (report ID included) without copying it
+        """
+        self.report.send(report)
         
         
     def read(self, timeout = -1):
         """
-        read data on the IN endpoint associated to the HID interface
+        read data on the IN endpoint associated to the HID interface, waiting at most timeout ms (forever if negative)
         """
-        while len(self.rcv_data) == 0:
-            pass
-        return self.rcv_data.pop(0)
+        return self.rcv_data.get(timeout)
     
     def close(self):
         """
@@ -120,3 +125,4 @@ class PyWinUSB(Interface):
         """
         logging.debug("closing interface")
         self.device.close()
+        self.rcv_data.close()
@@ -0,0 +1,123 @@
+"""
+MicroNFCBoard Python API
+
+Copyright (c) 2014-2015 AppNearMe Ltd
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from collections import deque
+from threading import Condition
+from timeit import default_timer
+import errno, logging
+
+# Reports kept before the overflow policy applies: twice transport.MAX_WINDOW, room for
+# every command in flight and as many late responses
+REPORT_QUEUE_SIZE = 64
+
+# What put() does with a full queue
+OVERFLOW_BLOCK = "block" #Wait for room, holding back the producer; responses are never lost
+OVERFLOW_DROP_OLDEST = "drop-oldest" #Make room by dropping the oldest report
+OVERFLOW_DROP_NEWEST = "drop-newest" #Drop the report being put
+
+class ReportQueue(object):
+    """
+    Bounded FIFO of the reports received by a callback-driven backend: the backend's
+    thread calls put() and read() waits in get() without spinning
+    Timeouts are in ms like Interface.read(), negative ones waiting forever
+    """
+    def __init__(self, size = REPORT_QUEUE_SIZE, overflow = OVERFLOW_BLOCK):
+        if overflow not in (OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST, OVERFLOW_BLOCK):
+            raise ValueError("Unknown overflow policy %r" % (overflow,))
+        self._size = size
+        self._overflow = overflow
+        self._reports = deque()
+        self._condition = Condition()
+        self._dropped = 0
+        self._closed = False
+
+    @property
+    def dropped(self):
+        """
+        Number of reports dropped on overflow
+        """
+        return self._dropped
+
+    def __len__(self):
+        return len(self._reports)
+
+    def put(self, report, timeout = -1):
+        """
+        Queue a report; with the block policy, wait at most timeout ms for room
+        and drop the report if there is still none
+        """
+        with self._condition:
+            if self._closed:
+                return
+            if len(self._reports) >= self._size:
+                if self._overflow == OVERFLOW_BLOCK:
+                    self._wait(lambda: len(self._reports) < self._size, timeout)
+                if len(self._reports) >= self._size:
+                    self._drop()
+                    if self._overflow != OVERFLOW_DROP_OLDEST:
+                        return
+                    self._reports.popleft()
+            self._reports.append(report)
+            self._condition.notify_all()
+
+    def get(self, timeout = -1):
+        """
+        Returns the oldest report, waiting at most timeout ms for one;
+        raises IOError with errno ETIMEDOUT if none came, EIO once closed
+        """
+        with self._condition:
+            if len(self._reports) == 0:
+                self._wait(lambda: len(self._reports) > 0, timeout)
+                if len(self._reports) == 0:
+                    if self._closed:
+                        raise IOError(errno.EIO, "Report queue closed")
+                    raise IOError(errno.ETIMEDOUT, "Timeout waiting for a report")
+            report = self._reports.popleft()
+            self._condition.notify_all() #Room for a blocked producer
+            return report
+
+    def clear(self):
+        with self._condition:
+            self._reports.clear()
+            self._condition.notify_all()
+
+    def close(self):
+        """
+        Wake up every waiting get() and put(); reports already queued can still be read
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def _wait(self, predicate, timeout):
+        #Called with the condition held, returns once predicate() is true, the queue closed or timeout ms elapsed
+        if timeout < 0:
+            while not (predicate() or self._closed):
+                self._condition.wait()
+            return
+        deadline = default_timer() + timeout / 1000.0
+        while not (predicate() or self._closed):
+            remaining = deadline - default_timer()
+            if remaining <= 0:
+                return
+            self._condition.wait(remaining)
+
+    def _drop(self):
+        self._dropped += 1
+        if self._dropped == 1:
+            logging.warning("Report queue full (%d reports), dropping reports", self._size)
@@ -0,0 +1,366 @@
+"""
+MicroNFCBoard Python API
+
+Copyright (c) 2014-2015 AppNearMe Ltd
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from interface import Interface
+from collections import deque
+from struct import pack, unpack_from
+import errno, logging, os, time
+
+from ..transport import COMMAND_ID
+from ..nfc.ndef import URIRecord, TextRecord, SmartPosterRecord, MIMERecord
+from ..nfc.uri import URI_PREFIXES, encodePrefix
+
+isAvailable = True
+
+# Mirrors the firmware status word (see board.py)
+_STATUS_POLLING        = (1 << 0)
+_STATUS_CONNECTED      = (1 << 1)
+_STATUS_NDEF_PRESENT   = (1 << 2)
+_STATUS_NDEF_READABLE  = (1 << 3)
+_STATUS_NDEF_WRITEABLE = (1 << 4)
+_STATUS_NDEF_BUSY      = (1 << 5)
+_STATUS_NDEF_SUCCESS   = (1 << 6)
+_STATUS_TYPE2          = (2 << 8)
+_STATUS_INITIATOR      = (1 << 16)
+
+_ERR_INVALID = 1
+_ERR_STATE   = 2
+
+REPORT_SIZE = 64
+
+# Number of record info words and data items per record type
+_RECORD_INFO_LENGTH = { 0: 0, 1: 2, 2: 3, 3: 2, 4: 2 }
+_RECORD_ITEMS = { 0: (), 1: (1,), 2: (1, 2), 3: (), 4: (0, 1) }
+
+TEXT_ENCODING = {"utf-8": 0, "utf-16": 1}
+
+class SimulatedError(Exception):
+    def __init__(self, code):
+        super(SimulatedError, self).__init__(code)
+        self.code = code
+
+class SimulatedRecord(object):
+    """
+    One entry of the firmware record table
+    """
+    def __init__(self, recordType, info):
+        self.type = recordType
+        self.info = list(info[0:_RECORD_INFO_LENGTH[recordType]])
+        self.items = [bytearray(info[i]) for i in _RECORD_ITEMS[recordType]]
+
+    def copy(self):
+        record = SimulatedRecord(self.type, self.info)
+        record.items = [bytearray(item) for item in self.items]
+        return record
+
+class SimulatedTag(object):
+    """
+    A type 2 tag that can be presented to a simulated board
+    """
+    def __init__(self, uid = "04A1B2C3D4E580", records = None, writeable = True, atqa = "0044", sak = "00"):
+        self.uid = bytearray(uid.decode("hex"))
+        self.atqa = bytearray(atqa.decode("hex"))
+        self.sak = bytearray(sak.decode("hex"))
+        self.writeable = writeable
+        self.count = 0
+        self.table = []
+        if records != None:
+            self.count, self.table = encodeRecordTable(records)
+
+    @property
+    def ndefPresent(self):
+        return self.count > 0
+
+def encodeRecordTable(records):
+    """
+    Builds the firmware record table for a list of NDEF records, smart poster sub-records
+    being stored after the main records
+    """
+    table = []
+    subRecords = []
+    for record in records:
+        if type(record) == SmartPosterRecord:
+            table.append(SimulatedRecord(3, [len(records) + len(subRecords), len(record.records)]))
+            subRecords += record.records
+        else:
+            table.append(_encodeRecord(record))
+    for record in subRecords:
+        table.append(_encodeRecord(record))
+    return len(records), table
+
+def _encodeRecord(record):
+    if type(record) == URIRecord:
+        uri = bytearray(record.uri.encode("utf-8"))
+        prefix, length = encodePrefix(str(uri))
+        simRecord = SimulatedRecord(1, [prefix, len(uri) - length])
+        simRecord.items = [uri[length:]]
+    elif type(record) == TextRecord:
+        language = bytearray(record.language.encode("utf-8"))
+        text = bytearray(record.text.encode(record.encoding))
+        simRecord = SimulatedRecord(2, [TEXT_ENCODING[record.encoding], len(language), len(text)])
+        simRecord.items = [language, text]
+    elif type(record) == MIMERecord:
+        mimeType = bytearray(record.mimeType.encode("utf-8"))
+        data = bytearray(record.data)
+        simRecord = SimulatedRecord(4, [len(mimeType), len(data)])
+        simRecord.items = [mimeType, data]
+    else:
+        raise SimulatedError(_ERR_INVALID)
+    return simRecord
+
+class SimulatorUSB(Interface):
+    """
+    This class simulates the MicroNFCBoard firmware in memory:
+        - the command set of transport.COMMAND_ID
+        - status word, record table and URI prefix table
+        - type 2 tags presented with placeTag() and removeTag()
+    Each report can be delayed by latency seconds to model USB round trips.
+    """
+    vid = 0
+    pid = 0
+
+    isAvailable = isAvailable
+
+    boardCount = int(os.getenv('MICRONFCBOARD_SIMULATOR_BOARDS', "1"))
+
+    version = (1, 5)
+
+    def __init__(self, boardNumber = 0):
+        super(SimulatorUSB, self).__init__()
+        self.vendor_name = "AppNearMe"
+        self.product_name = "MicroNFCBoard Simulator"
+        self.boardId = bytearray(pack(">I", boardNumber) + "\xA5" * 16)
+        self.latency = 0
+        self.leds = (False, False)
+        self.tag = None
+        self.responses = deque()
+        self._handlers = {
+                           COMMAND_ID['GET_STATUS']: self._getStatus,
+                           COMMAND_ID['INFO']: self._info,
+                           COMMAND_ID['RESET']: self._reset,
+                           COMMAND_ID['LEDS']: self._leds,
+                           COMMAND_ID['NFC_POLL']: self._nfcPoll,
+                           COMMAND_ID['NFC_OPERATION']: self._nfcOperation,
+                           COMMAND_ID['NFC_GET_INFO']: self._nfcGetInfo,
+                           COMMAND_ID['NFC_GET_MESSAGE_INFO']: self._nfcGetMessageInfo,
+                           COMMAND_ID['NFC_GET_RECORD_INFO']: self._nfcGetRecordInfo,
+                           COMMAND_ID['NFC_GET_RECORD_DATA']: self._nfcGetRecordData,
+                           COMMAND_ID['NFC_SET_MESSAGE_INFO']: self._nfcSetMessageInfo,
+                           COMMAND_ID['NFC_SET_RECORD_INFO']: self._nfcSetRecordInfo,
+                           COMMAND_ID['NFC_SET_RECORD_DATA']: self._nfcSetRecordData,
+                           COMMAND_ID['NFC_PREPARE_MESSAGE']: self._nfcPrepareMessage,
+                           COMMAND_ID['NFC_DECODE_PREFIX']: self._nfcDecodePrefix,
+                           COMMAND_ID['NFC_ENCODE_PREFIX']: self._nfcEncodePrefix,
+                         }
+        self._reset(None)
+
+    @staticmethod
+    def getAllConnectedInterface(vid, pid):
+        """
+        returns SimulatorUSB.boardCount simulated boards
+        returns an array of SimulatorUSB (Interface) objects
+        """
+        boards = []
+        for boardNumber in range(SimulatorUSB.boardCount):
+            new_board = SimulatorUSB(boardNumber)
+            new_board.vid = vid
+            new_board.pid = pid
+            boards.append(new_board)
+        return boards
+
+    def placeTag(self, tag):
+        """
+        present a tag to the antenna
+        """
+        self.tag = tag
+        self._update()
+
+    def removeTag(self):
+        """
+        remove the tag from the antenna, which ends the current connection
+        the staged message is kept until it is prepared again or the board is reset
+        """
+        self.tag = None
+        if self.status & _STATUS_CONNECTED:
+            self.status = 0
+
+    def write(self, data):
+        """
+        process a command report and queue its response
+        """
+        cmd = bytearray(data)
+        handler = self._handlers.get(cmd[0])
+        try:
+            if handler == None:
+                raise SimulatedError(_ERR_INVALID)
+            payload = handler(cmd)
+            if payload == None: #No response
+                return
+            resp = bytearray([cmd[0], 0]) + payload
+        except SimulatedError as e:
+            resp = bytearray([cmd[0], e.code])
+        resp += bytearray(REPORT_SIZE - len(resp))
+        self.responses.append((time.time() + self.latency, resp))
+
+    def read(self, timeout = -1):
+        """
+        return the oldest queued response
+        """
+        if (len(self.responses) == 0) and (timeout < 0):
+            raise IOError("No response pending") #A board would block forever
+        if len(self.responses) == 0:
+            time.sleep(timeout / 1000.0)
+            raise IOError(errno.ETIMEDOUT, "Timeout reading from the simulator")
+        deadline, resp = self.responses[0]
+        delay = deadline - time.time()
+        if (timeout >= 0) and (delay > timeout / 1000.0):
+            #The response stays queued and arrives late
+            time.sleep(timeout / 1000.0)
+            raise IOError(errno.ETIMEDOUT, "Timeout reading from the simulator")
+        self.responses.popleft()
+        if delay > 0:
+            time.sleep(delay)
+        return resp
+
+    def close(self):
+        """
+        close the interface
+        """
+        logging.debug("closing interface")
+        self.responses.clear()
+
+    def _update(self):
+        if (self.status & _STATUS_POLLING) and (self.modes & 1) and (self.tag != None):
+            self.status = _STATUS_CONNECTED | _STATUS_TYPE2 | _STATUS_INITIATOR
+            if self.tag.ndefPresent:
+                self.status |= _STATUS_NDEF_READABLE
+            if self.tag.writeable:
+                self.status |= _STATUS_NDEF_WRITEABLE
+
+    def _getStatus(self, cmd):
+        self._update()
+        return bytearray(pack(">I", self.status))
+
+    def _info(self, cmd):
+        return bytearray(pack(">HH", self.version[0], self.version[1])) + self.boardId
+
+    def _reset(self, cmd):
+        self.status = 0
+        self.modes = 0
+        self.count = 0
+        self.table = []
+        self.responses.clear()
+        return None
+
+    def _leds(self, cmd):
+        self.leds = (cmd[1] != 0, cmd[2] != 0)
+        return bytearray()
+
+    def _nfcPoll(self, cmd):
+        self.modes = cmd[1]
+        if self.modes != 0:
+            self.status = _STATUS_POLLING
+        else:
+            self.status &= ~_STATUS_POLLING
+        self._update()
+        return bytearray()
+
+    def _nfcOperation(self, cmd):
+        if not self.status & _STATUS_CONNECTED:
+            raise SimulatedError(_ERR_STATE)
+        self.status &= ~_STATUS_NDEF_SUCCESS
+        if cmd[1] == 1: #Read
+            if not self.status & _STATUS_NDEF_READABLE:
+                raise SimulatedError(_ERR_STATE)
+            self.count = self.tag.count
+            self.table = [record.copy() for record in self.tag.table]
+            self.status |= _STATUS_NDEF_PRESENT | _STATUS_NDEF_SUCCESS
+        elif cmd[1] == 2: #Write
+            if not self.status & _STATUS_NDEF_WRITEABLE:
+                raise SimulatedError(_ERR_STATE)
+            self.tag.count = self.count
+            self.tag.table = [record.copy() for record in self.table]
+            self.status |= _STATUS_NDEF_READABLE | _STATUS_NDEF_SUCCESS
+        return bytearray()
+
+    def _nfcGetInfo(self, cmd):
+        if not self.status & _STATUS_CONNECTED:
+            raise SimulatedError(_ERR_STATE)
+        return self.tag.atqa + self.tag.sak + bytearray([len(self.tag.uid)]) + self.tag.uid
+
+    def _nfcGetMessageInfo(self, cmd):
+        return bytearray(pack(">H", self.count))
+
+    def _record(self, recordNumber):
+        if recordNumber >= len(self.table):
+            raise SimulatedError(_ERR_INVALID)
+        return self.table[recordNumber]
+
+    def _nfcGetRecordInfo(self, cmd):
+        record = self._record(unpack_from(">H", cmd, 1)[0])
+        return bytearray(pack(">H", record.type) + "".join([pack(">H", i) for i in record.info]))
+
+    def _nfcGetRecordData(self, cmd):
+        recordNumber, item, offset, length = unpack_from(">HBHH", cmd, 1)
+        record = self._record(recordNumber)
+        if (item >= len(record.items)) or (length > REPORT_SIZE - 2) or (offset + length > len(record.items[item])):
+            raise SimulatedError(_ERR_INVALID)
+        return record.items[item][offset:offset+length]
+
+    def _nfcSetMessageInfo(self, cmd):
+        self.count = unpack_from(">H", cmd, 1)[0]
+        return bytearray()
+
+    def _nfcSetRecordInfo(self, cmd):
+        recordNumber, recordType = unpack_from(">HH", cmd, 1)
+        if recordType not in _RECORD_INFO_LENGTH:
+            raise SimulatedError(_ERR_INVALID)
+        info = unpack_from(">%dH" % _RECORD_INFO_LENGTH[recordType], cmd, 5)
+        while len(self.table) <= recordNumber:
+            self.table.append(SimulatedRecord(0, []))
+        self.table[recordNumber] = SimulatedRecord(recordType, info)
+        return bytearray()
+
+    def _nfcSetRecordData(self, cmd):
+        recordNumber, item, offset, length = unpack_from(">HBHH", cmd, 1)
+        record = self._record(recordNumber)
+        if (item >= len(record.items)) or (length > REPORT_SIZE - 8) or (offset + length > len(record.items[item])):
+            raise SimulatedError(_ERR_INVALID)
+        record.items[item][offset:offset+length] = cmd[8:8+length]
+        return bytearray()
+
+    def _nfcPrepareMessage(self, cmd):
+        if cmd[1] == 1: #Lock
+            self.status &= ~_STATUS_NDEF_PRESENT
+            self.count = 0
+            self.table = []
+        elif cmd[1] == 2: #Generate
+            self.table = [SimulatedRecord(record.type, record.info) for record in self.table]
+        return bytearray()
+
+    def _nfcDecodePrefix(self, cmd):
+        if cmd[1] >= len(URI_PREFIXES):
+            raise SimulatedError(_ERR_INVALID)
+        prefix = URI_PREFIXES[cmd[1]]
+        return bytearray(pack(">H", len(prefix)) + prefix)
+
+    def _nfcEncodePrefix(self, cmd):
+        length = unpack_from(">H", cmd, 1)[0]
+        if length > REPORT_SIZE - 3:
+            raise SimulatedError(_ERR_INVALID)
+        return bytearray(pack(">BH", *encodePrefix(str(cmd[3:3+length]))))
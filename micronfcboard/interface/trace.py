@@ -0,0 +1,167 @@
+"""
+MicroNFCBoard Python API
+
+Copyright (c) 2014-2015 AppNearMe Ltd
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from struct import Struct
+from time import sleep
+import errno
+from timeit import default_timer
+from interface import Interface
+
+# A trace file is TRACE_MAGIC followed by fixed size records: kind, valid data length,
+# timestamp in nanoseconds since the start of the trace, and up to TRACE_DATA bytes of data
+# (reports without their report ID, or the message of a read error)
+TRACE_MAGIC = b"MNFCTRC1"
+TRACE_WRITE = 0
+TRACE_READ = 1
+TRACE_ERROR = 2
+TRACE_HEADER = Struct("<BxHxxxxQ")
+TRACE_DATA = 64
+TRACE_RECORD_SIZE = TRACE_HEADER.size + TRACE_DATA
+
+class TraceRecorder(Interface):
+    """
+    Interface wrapper recording every report written and read to a trace file
+    """
+    def __init__(self, interface, trace):
+        super(TraceRecorder, self).__init__()
+        self._interface = interface
+        self.vid = interface.vid
+        self.pid = interface.pid
+        self.vendor_name = interface.vendor_name
+        self.product_name = interface.product_name
+        if hasattr(trace, "write"):
+            self._file = trace
+            self._ownFile = False
+        else:
+            self._file = open(trace, "wb")
+            self._ownFile = True
+        self._file.write(TRACE_MAGIC)
+        self._record = bytearray(TRACE_RECORD_SIZE)
+        self._start = default_timer()
+        
+    def _write(self, kind, data):
+        length = min(len(data), TRACE_DATA)
+        record = self._record
+        TRACE_HEADER.pack_into(record, 0, kind, length, int((default_timer() - self._start) * 1e9))
+        record[TRACE_HEADER.size:TRACE_HEADER.size+length] = data[0:length]
+        if length < TRACE_DATA:
+            record[TRACE_HEADER.size+length:] = bytearray(TRACE_DATA - length)
+        self._file.write(record)
+        
+    def init(self):
+        self._interface.init()
+        
+    def write(self, data):
+        self._write(TRACE_WRITE, bytearray(data))
+        self._interface.write(data)
+        
+    def writeReport(self, report):
+        self._write(TRACE_WRITE, memoryview(report)[1:])
+        self._interface.writeReport(report)
+        
+    def read(self, size = -1, timeout = -1):
+        try:
+            data = self._interface.read(timeout = timeout)
+        except Exception as e:
+            self._write(TRACE_ERROR, bytearray(str(e)))
+            raise
+        self._write(TRACE_READ, bytearray(data))
+        return data
+    
+    def readInto(self, buf, timeout = -1):
+        try:
+            length = self._interface.readInto(buf, timeout)
+        except Exception as e:
+            self._write(TRACE_ERROR, bytearray(str(e)))
+            raise
+        self._write(TRACE_READ, memoryview(buf)[0:length])
+        return length
+    
+    def close(self):
+        self._interface.close()
+        if self._ownFile:
+            self._file.close()
+        else:
+            self._file.flush()
+
+_TIMEOUT_PREFIX = "[Errno %d] " % (errno.ETIMEDOUT,)
+
+def readTrace(data):
+    """
+    Generator yielding (kind, timestamp in seconds, data) for each record of a trace held in a buffer
+    """
+    if bytes(data[0:len(TRACE_MAGIC)]) != TRACE_MAGIC:
+        raise ValueError("Not a trace file")
+    for off in range(len(TRACE_MAGIC), len(data) - TRACE_RECORD_SIZE + 1, TRACE_RECORD_SIZE):
+        kind, length, timestamp = TRACE_HEADER.unpack_from(data, off)
+        yield kind, timestamp / 1e9, data[off+TRACE_HEADER.size:off+TRACE_HEADER.size+length]
+
+class TraceReplayer(Interface):
+    """
+    Interface serving the responses of a trace back in order
+    Writes must match the recorded ones when strict; with realtime, each response
+    is delayed as it was when recorded, otherwise responses are served as fast as possible
+    """
+    def __init__(self, trace, realtime = False, strict = True):
+        super(TraceReplayer, self).__init__()
+        if hasattr(trace, "read"):
+            data = trace.read()
+        else:
+            with open(trace, "rb") as f:
+                data = f.read()
+        self._records = list(readTrace(bytearray(data)))
+        self._realtime = realtime
+        self._strict = strict
+        self._position = 0
+        self._offset = None
+        
+    def _next(self, kinds):
+        if self._position >= len(self._records):
+            raise IOError("End of trace")
+        kind, timestamp, data = self._records[self._position]
+        if kind not in kinds:
+            raise IOError("Replay diverged from the trace at record %d" % (self._position,))
+        self._position += 1
+        return kind, timestamp, data
+    
+    def write(self, data):
+        kind, timestamp, recorded = self._next((TRACE_WRITE,))
+        if self._strict and (bytearray(data) != recorded):
+            raise IOError("Replay wrote a different report at record %d" % (self._position - 1,))
+        if self._realtime:
+            self._offset = default_timer() - timestamp
+            
+    def read(self, size = -1, timeout = -1):
+        kind, timestamp, data = self._next((TRACE_READ, TRACE_ERROR))
+        if self._realtime and (self._offset != None):
+            delay = timestamp + self._offset - default_timer()
+            if delay > 0:
+                sleep(delay)
+        if kind == TRACE_ERROR:
+            message = str(data)
+            if message.startswith(_TIMEOUT_PREFIX): #Recorded timeouts stay recognizable
+                raise IOError(errno.ETIMEDOUT, message[len(_TIMEOUT_PREFIX):])
+            raise IOError(message)
+        return data
+    
+    @property
+    def remaining(self):
+        """
+        Number of trace records not replayed yet
+        """
+        return len(self._records) - self._position
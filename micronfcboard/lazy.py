@@ -0,0 +1,92 @@
+"""
+MicroNFCBoard Python API
+
+Copyright (c) 2014-2015 AppNearMe Ltd
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from nfc.ndef import URIRecord, TextRecord, SmartPosterRecord, MIMERecord
+
+class LazyURIRecord(URIRecord):
+    """
+    URI record fetching its URI from the board on first access
+    """
+    def __init__(self, fetch, decodePrefix, recordInfo):
+        super(LazyURIRecord, self).__init__()
+        self._fetch = fetch
+        self._decodePrefix = decodePrefix
+        self._recordInfo = recordInfo
+        
+    @property
+    def uri(self):
+        if self._uri == None:
+            self._uri = (self._decodePrefix(self._recordInfo[0]) + self._fetch(0, self._recordInfo[1])).decode("utf-8")
+        return self._uri
+    
+class LazyTextRecord(TextRecord):
+    """
+    Text record fetching its language code and text from the board on first access
+    """
+    def __init__(self, fetch, recordInfo, encoding):
+        super(LazyTextRecord, self).__init__(encoding = encoding)
+        self._fetch = fetch
+        self._recordInfo = recordInfo
+        
+    @property
+    def language(self):
+        if self._language == None:
+            self._language = self._fetch(0, self._recordInfo[1]).decode("utf-8")
+        return self._language
+    
+    @property
+    def text(self):
+        if self._text == None:
+            self._text = self._fetch(1, self._recordInfo[2]).decode(self._encoding)
+        return self._text
+    
+class LazySmartPosterRecord(SmartPosterRecord):
+    """
+    Smart poster record fetching its sub-records information from the board on first access
+    """
+    def __init__(self, fetchRecords):
+        super(LazySmartPosterRecord, self).__init__()
+        self._fetchRecords = fetchRecords
+        self._records = None
+        
+    @property
+    def records(self):
+        if self._records == None:
+            self._records = self._fetchRecords()
+        return self._records
+    
+class LazyMIMERecord(MIMERecord):
+    """
+    MIME record fetching its type and data from the board on first access
+    """
+    def __init__(self, fetch, recordInfo):
+        super(LazyMIMERecord, self).__init__()
+        self._fetch = fetch
+        self._recordInfo = recordInfo
+        
+    @property
+    def mimeType(self):
+        if self._mimeType == None:
+            self._mimeType = self._fetch(0, self._recordInfo[0]).decode("utf-8")
+        return self._mimeType
+    
+    @property
+    def data(self):
+        if self._data == None:
+            self._data = self._fetch(1, self._recordInfo[1])
+        return self._data
@@ -0,0 +1,246 @@
+"""
+MicroNFCBoard Python API
+
+Copyright (c) 2014-2015 AppNearMe Ltd
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from hashlib import sha1
+
+from nfc.ndef import URIRecord, TextRecord, SmartPosterRecord, MIMERecord, recordClass, dataView, dataSlice
+from nfc import uri
+
+TEXT_ENCODING = {0: "utf-8", 1: "utf-16"}
+TEXT_ENCODING_ID = {v: k for k, v in TEXT_ENCODING.items()}
+
+# Record types of the firmware record table
+RECORD_TYPE_UNKNOWN = 0
+RECORD_TYPE_URI = 1
+RECORD_TYPE_TEXT = 2
+RECORD_TYPE_SMART_POSTER = 3
+RECORD_TYPE_MIME = 4
+
+#Record info field holding the length of each item, per record type
+ITEM_LENGTH_FIELDS = { RECORD_TYPE_URI: (1,), RECORD_TYPE_TEXT: (1, 2), RECORD_TYPE_MIME: (0, 1) }
+
+class SmartPosterNestingException(Exception):
+    pass
+
+class CompiledMessage(object):
+    """
+    Upload plan of a NDEF message: the ordered transport commands filling the
+    firmware record table, data chunks being views on the encoded payloads.
+    Commands are kept as descriptors, their USB reports being encoded one batch at a
+    time when the message is written, so that large (memory-mapped) payloads are not
+    copied into reports held for the lifetime of the message.
+    A compiled message can be written to any number of boards and tags.
+    The digest identifies the content of the record table it stages.
+    """
+    def __init__(self, records, commands, chunkSize, digest, dataLength):
+        self._records = records
+        self._commands = commands
+        self._chunkSize = chunkSize
+        self._digest = digest
+        self._dataLength = dataLength
+        
+    @property
+    def records(self):
+        return self._records
+    
+    @property
+    def commands(self):
+        return self._commands
+    
+    @property
+    def chunkSize(self):
+        return self._chunkSize
+    
+    @property
+    def digest(self):
+        return self._digest
+    
+    @property
+    def dataLength(self):
+        """
+        Number of bytes sent by NFC_SET_RECORD_DATA commands
+        """
+        return self._dataLength
+    
+    def __len__(self):
+        return len(self._commands)
+
+def _bytes(value, encoding = "utf-8"):
+    if isinstance(value, unicode):
+        return bytearray(value.encode(encoding))
+    return bytearray(value)
+
+class MessageCompiler(object):
+    """
+    Turns a list of records (smart posters included) into a CompiledMessage in one pass
+    """
+    def __init__(self, chunkSize, encodePrefix = uri.encodePrefix):
+        self._chunkSize = chunkSize
+        self._encodePrefix = encodePrefix
+        self._compilers = { URIRecord : self._compileURIRecord,
+                            TextRecord : self._compileTextRecord,
+                            SmartPosterRecord : self._compileSmartPosterRecord,
+                            MIMERecord : self._compileMIMERecord,
+                          }
+        
+    def compile(self, records):
+        self._info = []
+        self._data = []
+        self._hash = sha1()
+        self._dataLength = 0
+        spRecordNumber = len(records) #Smart poster records after main records
+        for recordNumber, record in enumerate(records):
+            spRecordNumber = self._compileRecord(recordNumber, record, spRecordNumber)
+        commands = [('NFC_PREPARE_MESSAGE', True, False)] + self._info
+        commands += [('NFC_SET_MESSAGE_INFO', len(records)), ('NFC_PREPARE_MESSAGE', False, True)] + self._data
+        self._hash.update(repr(commands[:len(self._info) + 3]))
+        message = CompiledMessage(records, commands, self._chunkSize, self._hash.hexdigest(), self._dataLength)
+        self._info = self._data = self._hash = None
+        return message
+    
+    def _compileRecord(self, recordNumber, record, recordsStart, spAllowed = True):
+        if( not spAllowed and isinstance(record, SmartPosterRecord) ):
+            raise SmartPosterNestingException()
+        
+        return self._compilers[recordClass(record)](recordNumber, record, recordsStart)
+        
+    def _compileURIRecord(self, recordNumber, record, spRecordNumber):
+        buf = _bytes(record.uri)
+        prefix, length = self._encodePrefix(str(buf))
+        
+        self._info.append(('NFC_SET_RECORD_INFO', recordNumber, RECORD_TYPE_URI, [prefix, len(buf) - length]))
+        self._addData(recordNumber, 0, memoryview(buf)[length:])
+        
+        return spRecordNumber
+        
+    def _compileTextRecord(self, recordNumber, record, spRecordNumber):
+        languageCodeBuf = _bytes(record.language)
+        textBuf = _bytes(record.text, record.encoding)
+        
+        self._info.append(('NFC_SET_RECORD_INFO', recordNumber, RECORD_TYPE_TEXT, [TEXT_ENCODING_ID[record.encoding], len(languageCodeBuf), len(textBuf)]))
+        self._addData(recordNumber, 0, memoryview(languageCodeBuf))
+        self._addData(recordNumber, 1, memoryview(textBuf))
+        
+        return spRecordNumber
+        
+    def _compileSmartPosterRecord(self, recordNumber, record, recordsStart):
+        self._info.append(('NFC_SET_RECORD_INFO', recordNumber, RECORD_TYPE_SMART_POSTER, [recordsStart, len(record.records)]))
+        spRecordNumber = recordsStart
+        
+        for spRecord in record.records:
+            self._compileRecord(spRecordNumber, spRecord, 0, False) #No sub records
+            spRecordNumber += 1
+            
+        return spRecordNumber
+    
+    def _compileMIMERecord(self, recordNumber, record, spRecordNumber):
+        mimeTypeBuf = _bytes(record.mimeType)
+        dataBuf = dataView(record.data)
+        
+        self._info.append(('NFC_SET_RECORD_INFO', recordNumber, RECORD_TYPE_MIME, [len(mimeTypeBuf), len(dataBuf)]))
+        self._addData(recordNumber, 0, memoryview(mimeTypeBuf))
+        self._addData(recordNumber, 1, dataBuf)
+        
+        return spRecordNumber
+    
+    def _addData(self, recordNumber, item, itemData):
+        self._hash.update(itemData)
+        itemLength = len(itemData)
+        self._dataLength += itemLength
+        for itemOff in range(0, itemLength, self._chunkSize):
+            self._data.append(('NFC_SET_RECORD_DATA', recordNumber, item, itemOff, dataSlice(itemData, itemOff, min(itemOff + self._chunkSize, itemLength))))
+
+def itemLengths(recordType, recordInfo):
+    """
+    Returns the length of each data item of a record, from its record info
+    """
+    return [recordInfo[field] for field in ITEM_LENGTH_FIELDS.get(recordType, ())]
+
+def parseRecord(recordType, recordInfo, item, decodePrefix, records):
+    """
+    Build a record from its record table entry, returning None for unknown types
+    item(number) returns the data of an item, decodePrefix(code) a URI prefix
+    and records(start, count) the records of a smart poster
+    """
+    if recordType == RECORD_TYPE_URI:
+        return URIRecord((decodePrefix(recordInfo[0]) + item(0)).decode("utf-8"))
+    if recordType == RECORD_TYPE_TEXT:
+        encoding = TEXT_ENCODING[recordInfo[0]]
+        return TextRecord(item(1).decode(encoding), item(0).decode("utf-8"), encoding)
+    if recordType == RECORD_TYPE_SMART_POSTER:
+        return SmartPosterRecord(records(recordInfo[0], recordInfo[1]))
+    if recordType == RECORD_TYPE_MIME:
+        return MIMERecord(item(0).decode("utf-8"), item(1))
+    return None
+
+class MessageReader(object):
+    """
+    Reads a NDEF message back from the firmware record table: run() is a generator yielding
+    batches of transport command descriptors and expecting the list of their results through send()
+    Records info are read level by level and data chunks span items and records, so that
+    a message takes a few round trips of up to batchSize commands; records is set once run() is exhausted
+    """
+    def __init__(self, chunkSize, batchSize, localPrefixes = True):
+        self._chunkSize = chunkSize
+        self._batchSize = batchSize
+        self._localPrefixes = localPrefixes
+        self.records = None
+        
+    def run(self):
+        count = (yield [('NFC_GET_MESSAGE_INFO',)])[0]
+        infos = {}
+        recordNumbers = range(count)
+        while len(recordNumbers) > 0: #Main records, then the records of smart posters
+            results = yield [('NFC_GET_RECORD_INFO', recordNumber) for recordNumber in recordNumbers]
+            infos.update(zip(recordNumbers, results))
+            recordNumbers = []
+            for recordType, recordInfo in results:
+                if recordType == RECORD_TYPE_SMART_POSTER:
+                    recordNumbers += [n for n in range(recordInfo[0], recordInfo[0] + recordInfo[1]) if n not in infos]
+        
+        items = {}
+        chunks = []
+        for recordNumber, (recordType, recordInfo) in sorted(infos.items()):
+            for item, itemLength in enumerate(itemLengths(recordType, recordInfo)):
+                items[(recordNumber, item)] = bytearray(itemLength)
+                chunks += [(recordNumber, item, itemOff, min(self._chunkSize, itemLength - itemOff)) for itemOff in range(0, itemLength, self._chunkSize)]
+        for start in range(0, len(chunks), self._batchSize):
+            batch = chunks[start:start+self._batchSize]
+            results = yield [('NFC_GET_RECORD_DATA',) + chunk for chunk in batch]
+            for (recordNumber, item, itemOff, length), data in zip(batch, results):
+                items[(recordNumber, item)][itemOff:itemOff+length] = data
+        
+        prefixes = {}
+        if not self._localPrefixes:
+            codes = sorted(set([recordInfo[0] for recordType, recordInfo in infos.values() if recordType == RECORD_TYPE_URI]))
+            results = yield [('NFC_DECODE_PREFIX', code) for code in codes]
+            prefixes = dict(zip(codes, [prefix.tobytes() for prefix in results]))
+        
+        self.records = _buildRecords(infos, items, prefixes, 0, count)
+
+def _buildRecords(infos, items, prefixes, start, count):
+    #Records start to start + count from the record table entries and item data read
+    decodePrefix = lambda code: prefixes[code] if code in prefixes else uri.decodePrefix(code)
+    subRecords = lambda start, count: _buildRecords(infos, items, prefixes, start, count)
+    records = []
+    for recordNumber in range(start, start + count):
+        recordType, recordInfo = infos[recordNumber]
+        record = parseRecord(recordType, recordInfo, lambda item: items[(recordNumber, item)], decodePrefix, subRecords)
+        if record != None:
+            records.append(record)
+    return records
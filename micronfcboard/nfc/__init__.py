@@ -16,4 +16,5 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-import ndef
\ No newline at end of file
+import ndef
+import uri
@@ -16,6 +16,14 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import codecs
+import os
+import mmap
+import stat
+from struct import Struct
+
+import uri
+
 class Record(object):
     def __init__(self, recordType):
         self._type = recordType
@@ -38,7 +46,7 @@ class URIRecord(Record):
         return self._uri
     
     def __str__(self):
-        return Record.__str__(self) + ": URI = %s" % (self._uri,)
+        return Record.__str__(self) + ": URI = %s" % (self.uri,)
     
 class TextRecord(Record):
     def __init__(self, text = None, language = None, encoding="utf-8"):
@@ -60,7 +68,7 @@ class TextRecord(Record):
         return self._encoding
     
     def __str__(self):
-        return Record.__str__(self) + ": Language = %s, Text = %s, Encoding = %s" % (self._language, self.text, self.encoding)
+        return Record.__str__(self) + ": Language = %s, Text = %s, Encoding = %s" % (self.language, self.text, self.encoding)
     
 class SmartPosterRecord(Record):
     def __init__(self, records = []):
@@ -75,14 +83,24 @@ class SmartPosterRecord(Record):
     
     def __str__(self):
         text = Record.__str__(self)
-        for r in self._records:
+        for r in self.records:
             text += "\r\n\t" + r.__str__()
         return text
     
 class MIMERecord(Record):
-    def __init__(self, mimeType = None, data = None):
+    def __init__(self, mimeType = None, data = None, path = None):
+        """
+        data can be any buffer (bytearray, str, memoryview, mmap, array) or a file object,
+        read from its current position; path names a file to use as data
+        Files are memory-mapped rather than read when possible
+        """
         super(MIMERecord, self).__init__("MIME")
         self._mimeType = mimeType
+        if path != None:
+            with open(path, "rb") as f:
+                data = _mapFile(f)
+        elif hasattr(data, "read"):
+            data = _mapFile(data)
         self._data = data
         
     @property
@@ -94,4 +112,272 @@ class MIMERecord(Record):
         return self._data
     
     def __str__(self):
-        return Record.__str__(self) + ": Type = %s, Data Length = %d" % (self._mimeType, len(self._data))
+        return Record.__str__(self) + ": Type = %s, Data Length = %d" % (self.mimeType, len(self.data))
+
+def _mapFile(f):
+    try:
+        fileno = f.fileno()
+    except (AttributeError, IOError): #In-memory file objects
+        fileno = None
+    if (fileno == None) or not stat.S_ISREG(os.fstat(fileno).st_mode): #Pipes, FIFOs, terminals cannot be mapped
+        return f.read()
+    position = f.tell()
+    if os.fstat(fileno).st_size <= position:
+        return bytearray()
+    data = mmap.mmap(fileno, 0, access = mmap.ACCESS_READ)
+    if position > 0:
+        return dataSlice(dataView(data), position, len(data))
+    return data
+
+def dataView(data):
+    """
+    Returns a view on data that can be sliced with dataSlice without copying
+    (objects lacking the new buffer interface on Python 2, such as mmap, get an old-style buffer)
+    """
+    try:
+        return memoryview(data)
+    except TypeError:
+        pass
+    try:
+        return buffer(data)
+    except (NameError, TypeError): #Lists of ints
+        return memoryview(bytearray(data))
+    
+def dataSlice(view, start, end):
+    if isinstance(view, memoryview):
+        return view[start:end]
+    return buffer(view, start, end - start)
+
+RECORD_CLASSES = (URIRecord, TextRecord, SmartPosterRecord, MIMERecord)
+
+def recordClass(record):
+    """
+    Returns the record class of record, so that subclasses are handled like their base class
+    """
+    for cls in type(record).__mro__:
+        if cls in RECORD_CLASSES:
+            return cls
+    raise KeyError(type(record))
+
+# NDEF wire format
+
+TNF_EMPTY = 0
+TNF_WELL_KNOWN = 1
+TNF_MIME = 2
+TNF_ABSOLUTE_URI = 3
+TNF_EXTERNAL = 4
+TNF_UNKNOWN = 5
+TNF_UNCHANGED = 6
+
+FLAG_MB = 0x80 #Message begin
+FLAG_ME = 0x40 #Message end
+FLAG_CF = 0x20 #Chunk flag
+FLAG_SR = 0x10 #Short record
+FLAG_IL = 0x08 #ID length present
+TNF_MASK = 0x07
+
+_HEADER = Struct(">BB")
+_SHORT_LENGTH = Struct(">B")
+_LENGTH = Struct(">I")
+
+TEXT_UTF16 = 0x80
+TEXT_LANGUAGE_MASK = 0x3F
+
+def _view(data):
+    if isinstance(data, unicode):
+        data = data.encode("utf-8")
+    try:
+        return memoryview(data)
+    except TypeError: #array.array or list of ints
+        return memoryview(bytearray(data))
+    
+def _join(parts):
+    buf = bytearray(sum([len(part) for part in parts]))
+    off = 0
+    for part in parts:
+        buf[off:off+len(part)] = part
+        off += len(part)
+    return memoryview(buf)
+    
+def _decode(view, encoding):
+    return codecs.lookup(encoding).decode(view)[0]
+
+def _encodeURIRecord(record, chunkSize):
+    uriData = _view(record.uri)
+    prefix, length = uri.encodePrefix(uriData.tobytes())
+    return TNF_WELL_KNOWN, "U", [_SHORT_LENGTH.pack(prefix), uriData[length:]]
+
+def _encodeTextRecord(record, chunkSize):
+    language = _view(record.language)
+    if isinstance(record.text, unicode):
+        text = memoryview(record.text.encode(record.encoding))
+    else:
+        text = _view(record.text)
+    if len(language) > TEXT_LANGUAGE_MASK:
+        raise ValueError("Language code too long")
+    status = len(language)
+    if record.encoding == "utf-16":
+        status |= TEXT_UTF16
+    return TNF_WELL_KNOWN, "T", [_SHORT_LENGTH.pack(status), language, text]
+
+def _encodeSmartPosterRecord(record, chunkSize):
+    return TNF_WELL_KNOWN, "Sp", [memoryview(encodeMessage(record.records, chunkSize))]
+
+def _encodeMIMERecord(record, chunkSize):
+    return TNF_MIME, _view(record.mimeType).tobytes(), [dataView(record.data)]
+
+_ENCODERS = { URIRecord : _encodeURIRecord,
+              TextRecord : _encodeTextRecord,
+              SmartPosterRecord : _encodeSmartPosterRecord,
+              MIMERecord : _encodeMIMERecord,
+            }
+
+def _appendRecord(fields, tnf, recordType, payload, chunkSize):
+    #A record is a list of [flags, type, payload parts]
+    length = sum([len(part) for part in payload])
+    if (chunkSize == None) or (length <= chunkSize):
+        fields.append([tnf, recordType, payload])
+        return
+    #Split the payload in chunks of chunkSize bytes
+    data = _join(payload)
+    for off in range(0, length, chunkSize):
+        if off == 0:
+            fields.append([FLAG_CF | tnf, recordType, [data[0:chunkSize]]])
+        elif off + chunkSize < length:
+            fields.append([FLAG_CF | TNF_UNCHANGED, "", [data[off:off+chunkSize]]])
+        else:
+            fields.append([TNF_UNCHANGED, "", [data[off:]]])
+
+def encodeMessage(records, chunkSize = None):
+    """
+    Serialize a list of records to a NDEF message, returned as a bytearray
+    Payloads longer than chunkSize bytes are split in chunked records
+    """
+    fields = []
+    for record in records:
+        tnf, recordType, payload = _ENCODERS[recordClass(record)](record, chunkSize)
+        _appendRecord(fields, tnf, recordType, payload, chunkSize)
+    if len(fields) == 0:
+        fields.append([TNF_EMPTY, "", []])
+    fields[0][0] |= FLAG_MB
+    fields[-1][0] |= FLAG_ME
+    
+    #Size the message first so that it is filled in place
+    size = 0
+    for field in fields:
+        length = sum([len(part) for part in field[2]])
+        if length < 256:
+            field[0] |= FLAG_SR
+            size += _HEADER.size + _SHORT_LENGTH.size
+        else:
+            size += _HEADER.size + _LENGTH.size
+        size += len(field[1]) + length
+        field.append(length)
+    
+    buf = bytearray(size)
+    off = 0
+    for flags, recordType, payload, length in fields:
+        _HEADER.pack_into(buf, off, flags, len(recordType))
+        off += _HEADER.size
+        if flags & FLAG_SR:
+            _SHORT_LENGTH.pack_into(buf, off, length)
+            off += _SHORT_LENGTH.size
+        else:
+            _LENGTH.pack_into(buf, off, length)
+            off += _LENGTH.size
+        buf[off:off+len(recordType)] = recordType
+        off += len(recordType)
+        for part in payload:
+            buf[off:off+len(part)] = part
+            off += len(part)
+    return buf
+
+def _decodeURIRecord(payload):
+    if len(payload) < 1:
+        raise ValueError("Invalid URI record")
+    prefix = uri.decodePrefix(_SHORT_LENGTH.unpack_from(payload, 0)[0])
+    return URIRecord(prefix.decode("utf-8") + _decode(payload[1:], "utf-8"))
+
+def _decodeTextRecord(payload):
+    if len(payload) < 1:
+        raise ValueError("Invalid text record")
+    status = _SHORT_LENGTH.unpack_from(payload, 0)[0]
+    encoding = "utf-16" if status & TEXT_UTF16 else "utf-8"
+    languageEnd = 1 + (status & TEXT_LANGUAGE_MASK)
+    if languageEnd > len(payload):
+        raise ValueError("Invalid text record")
+    return TextRecord(_decode(payload[languageEnd:], encoding), _decode(payload[1:languageEnd], "utf-8"), encoding)
+
+def _decodeSmartPosterRecord(payload):
+    return SmartPosterRecord(decodeMessage(payload))
+
+_DECODERS = { (TNF_WELL_KNOWN, "U") : _decodeURIRecord,
+              (TNF_WELL_KNOWN, "T") : _decodeTextRecord,
+              (TNF_WELL_KNOWN, "Sp") : _decodeSmartPosterRecord,
+            }
+
+def _decodeRecord(tnf, recordType, payload):
+    if tnf == TNF_MIME:
+        return MIMERecord(recordType.decode("utf-8"), payload)
+    decoder = _DECODERS.get((tnf, recordType))
+    if decoder == None:
+        return None #Unsupported record type
+    return decoder(payload)
+
+def decodeMessage(buf):
+    """
+    Parse a NDEF message from any buffer
+    MIME data are memoryviews on buf (unless chunked); records of unsupported types are skipped
+    """
+    view = _view(buf)
+    length = len(view)
+    records = []
+    chunks = None
+    off = 0
+    flags = 0
+    while not flags & FLAG_ME:
+        if off + _HEADER.size > length:
+            raise ValueError("Truncated NDEF message")
+        flags, typeLength = _HEADER.unpack_from(view, off)
+        off += _HEADER.size
+        if bool(flags & FLAG_MB) != (off == _HEADER.size):
+            raise ValueError("Invalid MB flag at offset %d" % (off - _HEADER.size,))
+        lengthField = _SHORT_LENGTH if flags & FLAG_SR else _LENGTH
+        if off + lengthField.size > length:
+            raise ValueError("Truncated NDEF message")
+        payloadLength = lengthField.unpack_from(view, off)[0]
+        off += lengthField.size
+        idLength = 0
+        if flags & FLAG_IL:
+            if off >= length:
+                raise ValueError("Truncated NDEF message")
+            idLength = _SHORT_LENGTH.unpack_from(view, off)[0]
+            off += _SHORT_LENGTH.size
+        end = off + typeLength + idLength + payloadLength
+        if end > length:
+            raise ValueError("Truncated NDEF message")
+        tnf = flags & TNF_MASK
+        recordType = view[off:off+typeLength].tobytes()
+        payload = view[off+typeLength+idLength:end]
+        off = end
+        
+        if chunks != None: #Middle or terminating chunk
+            if (tnf != TNF_UNCHANGED) or (typeLength != 0):
+                raise ValueError("Invalid chunked record")
+            chunks[2].append(payload)
+            if flags & FLAG_CF:
+                continue
+            tnf, recordType, payload = chunks[0], chunks[1], _join(chunks[2])
+            chunks = None
+        elif flags & FLAG_CF: #Initial chunk
+            chunks = (tnf, recordType, [payload])
+            continue
+        elif tnf == TNF_UNCHANGED:
+            raise ValueError("Invalid chunked record")
+        
+        record = _decodeRecord(tnf, recordType, payload)
+        if record != None:
+            records.append(record)
+    if chunks != None:
+        raise ValueError("Truncated chunked record")
+    return records
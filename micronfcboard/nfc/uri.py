@@ -0,0 +1,58 @@
+"""
+MicroNFCBoard Python API
+
+Copyright (c) 2014-2015 AppNearMe Ltd
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+# NFC Forum URI Record Type Definition, identifier codes 0x00 to 0x23
+URI_PREFIXES = [ "", "http://www.", "https://www.", "http://", "https://", "tel:", "mailto:",
+                 "ftp://anonymous:anonymous@", "ftp://ftp.", "ftps://", "sftp://", "smb://",
+                 "nfs://", "ftp://", "dav://", "news:", "telnet://", "imap:", "rtsp://", "urn:",
+                 "pop:", "sip:", "sips:", "tftp:", "btspp://", "btl2cap://", "btgoep://",
+                 "tcpobex://", "irdaobex://", "file://", "urn:epc:id:", "urn:epc:tag:",
+                 "urn:epc:pat:", "urn:epc:raw:", "urn:epc:", "urn:nfc:" ]
+
+def _buildTrie(prefixes):
+    #Each node maps a character to its child node, the None key holding the code of the prefix ending there
+    root = {None: 0}
+    for code in range(1, len(prefixes)):
+        node = root
+        for c in prefixes[code]:
+            node = node.setdefault(c, {})
+        node[None] = code
+    return root
+
+_TRIE = _buildTrie(URI_PREFIXES)
+
+def encodePrefix(uri):
+    """
+    Returns the identifier code of the longest prefix of uri and the length of that prefix
+    """
+    node = _TRIE
+    prefix = 0
+    for c in uri:
+        node = node.get(c)
+        if node == None:
+            break
+        prefix = node.get(None, prefix)
+    return prefix, len(URI_PREFIXES[prefix])
+
+def decodePrefix(prefix):
+    """
+    Returns the prefix string of an identifier code
+    """
+    if prefix >= len(URI_PREFIXES):
+        raise ValueError("Invalid URI identifier code %d" % prefix)
+    return URI_PREFIXES[prefix]
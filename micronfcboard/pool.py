@@ -0,0 +1,204 @@
+"""
+MicroNFCBoard Python API
+
+Copyright (c) 2014-2015 AppNearMe Ltd
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from threading import Thread, Event
+from Queue import Queue
+import sys
+
+from board import MicroNFCBoard
+
+class BoardCall(object):
+    """
+    Result of a call queued on a board worker
+    """
+    def __init__(self, board, func, args):
+        self._board = board
+        self._func = func
+        self._args = args
+        self._done = Event()
+        self._result = None
+        self._excInfo = None
+        
+    @property
+    def board(self):
+        return self._board
+        
+    def done(self):
+        return self._done.is_set()
+    
+    def result(self, timeout = None):
+        """
+        Waits for the call and returns its result, or raises its exception
+        """
+        if not self._done.wait(timeout):
+            raise RuntimeError("Call on board %s still running" % (self._board.id,))
+        if self._excInfo != None:
+            raise self._excInfo[0], self._excInfo[1], self._excInfo[2]
+        return self._result
+    
+    def _run(self):
+        try:
+            self._result = self._func(self._board, *self._args)
+        except Exception:
+            self._excInfo = sys.exc_info()
+        self._done.set()
+
+class BoardWorker(Thread):
+    """
+    Thread running the calls queued for one board, in order
+    """
+    def __init__(self, board):
+        super(BoardWorker, self).__init__(name = "MicroNFCBoard worker")
+        self.daemon = True
+        self._board = board
+        self._queue = Queue()
+        
+    @property
+    def board(self):
+        return self._board
+    
+    def submit(self, func, *args):
+        """
+        Queue func(board, *args), returning a BoardCall
+        """
+        call = BoardCall(self._board, func, args)
+        self._queue.put(call)
+        return call
+    
+    def stop(self):
+        self._queue.put(None)
+        self.join()
+    
+    def run(self):
+        while True:
+            call = self._queue.get()
+            if call == None:
+                break
+            call._run()
+
+class BoardPool(object):
+    """
+    Drives several boards in parallel, each one from its own worker thread and command queue.
+    Fan-out methods run on every board at once and return the list of results, in board order.
+    The boards are opened in parallel unless open is False.
+    """
+    def __init__(self, boards = None, open = True):
+        if boards == None:
+            boards = MicroNFCBoard.getAllBoards()
+        self._workers = [BoardWorker(board) for board in boards]
+        for worker in self._workers:
+            worker.start()
+        if open:
+            self._openAll()
+    
+    @property
+    def boards(self):
+        return [worker.board for worker in self._workers]
+    
+    def __len__(self):
+        return len(self._workers)
+    
+    def __iter__(self):
+        return iter(self.boards)
+    
+    def submit(self, number, func, *args):
+        """
+        Queue func(board, *args) on board number, returning a BoardCall
+        """
+        return self._workers[number].submit(func, *args)
+    
+    def map(self, func, *args):
+        """
+        Queue func(board, *args) on every board, returning the list of BoardCall
+        """
+        return [worker.submit(func, *args) for worker in self._workers]
+    
+    def broadcast(self, func, *args):
+        """
+        Run func(board, *args) on every board and wait for all of them, returning
+        their results or raising the first exception
+        """
+        calls = self.map(func, *args)
+        for call in calls:
+            call._done.wait()
+        return [call.result() for call in calls]
+    
+    def open(self):
+        return self.broadcast(MicroNFCBoard.open)
+    
+    def _openAll(self):
+        #Open every board; if one fails, close the others and stop the workers before raising
+        calls = self.map(MicroNFCBoard.open)
+        for call in calls:
+            call._done.wait()
+        failed = [call for call in calls if call._excInfo != None]
+        if len(failed) == 0:
+            return
+        for call in calls:
+            if call._excInfo == None:
+                try:
+                    call.board.close()
+                except Exception:
+                    pass
+        for worker in self._workers:
+            worker.stop()
+        failed[0].result()
+        
+    def close(self):
+        try:
+            self.broadcast(MicroNFCBoard.close)
+        finally:
+            for worker in self._workers:
+                worker.stop()
+    
+    def snapshots(self):
+        return self.broadcast(MicroNFCBoard.snapshot)
+    
+    def startPolling(self, readerWriter, emulator, p2p):
+        return self.broadcast(MicroNFCBoard.startPolling, readerWriter, emulator, p2p)
+    
+    def stopPolling(self):
+        return self.broadcast(MicroNFCBoard.stopPolling)
+    
+    def setNdefRecords(self, records):
+        """
+        Stage the same NDEF message on every board (for instance for tag emulation)
+        """
+        def setRecords(board):
+            board.ndefRecords = records
+        return self.broadcast(setRecords)
+    
+    def setLeds(self, led1, led2):
+        return self.broadcast(MicroNFCBoard.setLeds, led1, led2)
+    
+    def addEventListener(self, listener):
+        """
+        Merge the event streams of all boards into listener, events.Event.board telling them apart
+        """
+        for worker in self._workers:
+            worker.board.addEventListener(listener)
+    
+    def removeEventListener(self, listener):
+        for worker in self._workers:
+            worker.board.removeEventListener(listener)
+    
+    def startEvents(self, *args):
+        return self.broadcast(MicroNFCBoard.startEvents, *args)
+    
+    def stopEvents(self):
+        return self.broadcast(MicroNFCBoard.stopEvents)
@@ -0,0 +1,679 @@
+"""
+MicroNFCBoard Python API
+
+Copyright (c) 2014-2015 AppNearMe Ltd
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from threading import Thread, Condition
+from collections import deque
+from heapq import heappush, heappop
+from timeit import default_timer
+import errno, fcntl, logging, os, select
+
+from transport import COMMANDS, REPORT_SIZE, ProtocolError, CommandError, TimeoutError
+from events import FAST_INTERVAL, SLOW_INTERVAL
+from message import CompiledMessage
+
+class Return(StopIteration):
+    """
+    Raised by an operation generator to complete with a value
+    """
+    def __init__(self, value = None):
+        super(Return, self).__init__(value)
+        self.value = value
+
+class EpollPoller(object):
+    """
+    Waits for file descriptors with epoll
+    """
+    def __init__(self):
+        self._epoll = select.epoll()
+
+    def bind(self, reactor):
+        pass
+
+    def register(self, fd):
+        self._epoll.register(fd, select.EPOLLIN)
+
+    def unregister(self, fd):
+        self._epoll.unregister(fd)
+
+    def reschedule(self, deadline):
+        pass
+
+    def poll(self, timeout):
+        return [fd for fd, event in self._epoll.poll(-1 if timeout == None else timeout)]
+
+    def close(self):
+        self._epoll.close()
+
+class SelectPoller(object):
+    """
+    Waits for file descriptors with select, where epoll is not available
+    """
+    def __init__(self):
+        self._fds = set()
+
+    def bind(self, reactor):
+        pass
+
+    def register(self, fd):
+        self._fds.add(fd)
+
+    def unregister(self, fd):
+        self._fds.discard(fd)
+
+    def reschedule(self, deadline):
+        pass
+
+    def poll(self, timeout):
+        return select.select(list(self._fds), [], [], timeout)[0]
+
+    def close(self):
+        pass
+
+def _pipe():
+    r, w = os.pipe()
+    for fd in (r, w):
+        fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+    return r, w
+
+def _drain(fd):
+    try:
+        while len(os.read(fd, 4096)) == 4096:
+            pass
+    except OSError as e:
+        if e.errno != errno.EAGAIN:
+            raise
+
+# Milliseconds a reader thread waits for a report before checking whether it was stopped
+READ_INTERVAL = 50
+
+class ReaderThread(Thread):
+    """
+    Blocking reads for interfaces without a file descriptor: each expected report
+    is read on this thread, queued and signalled through a pipe the reactor waits on
+    """
+    def __init__(self, interface):
+        super(ReaderThread, self).__init__(name = "MicroNFCBoard reader")
+        self.daemon = True
+        self._interface = interface
+        self._reports = deque()
+        self._condition = Condition()
+        self._expected = 0
+        self._stopped = False
+        self._r, self._w = _pipe()
+
+    def fileno(self):
+        return self._r
+
+    def expect(self):
+        """
+        Read one more report
+        """
+        with self._condition:
+            self._expected += 1
+            self._condition.notify()
+
+    def reports(self):
+        """
+        Returns the list of (report, exception) read since the last call
+        """
+        _drain(self._r)
+        reports = []
+        while len(self._reports) > 0:
+            reports.append(self._reports.popleft())
+        return reports
+
+    def stop(self):
+        """
+        Ask the thread to exit, which it does within READ_INTERVAL ms
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def close(self):
+        """
+        Stop the thread, wait for it and close the pipe; returns the reports read but not yet collected
+        """
+        self.stop()
+        self.join()
+        os.close(self._r)
+        os.close(self._w)
+        return list(self._reports)
+
+    def run(self):
+        rx = None
+        while True:
+            with self._condition:
+                while (self._expected == 0) and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+            if rx == None:
+                rx = bytearray(REPORT_SIZE)
+            try:
+                self._interface.readInto(rx, READ_INTERVAL)
+            except IOError as e:
+                if e.errno == errno.ETIMEDOUT:
+                    continue #Still expected, unless stopped in the meantime
+                self._reports.append((None, e))
+            except Exception as e:
+                self._reports.append((None, e))
+            else:
+                self._reports.append((rx, None))
+                rx = None
+            with self._condition:
+                self._expected -= 1
+            os.write(self._w, b"\0")
+
+class _Timer(object):
+    __slots__ = ('deadline', 'func', 'args')
+
+    def __init__(self, deadline, func, args):
+        self.deadline = deadline
+        self.func = func
+        self.args = args
+
+    def cancel(self):
+        self.func = None
+
+    def __lt__(self, other):
+        return self.deadline < other.deadline
+
+class _Operation(object):
+    def __init__(self, generator, callback):
+        self.generator = generator
+        self.callback = callback
+
+class _Channel(object):
+    """
+    Command state machine of one board: runs operations one after the other, writing the
+    commands of the current batch up to the pipelining window and matching responses in order
+    """
+    def __init__(self, reactor, board, fastInterval, slowInterval):
+        self.reactor = reactor
+        self.board = board
+        self.interface = board._intf
+        self.fastInterval = fastInterval
+        self.slowInterval = slowInterval
+        fileno = getattr(self.interface, "fileno", None)
+        if (fileno != None) and (fileno() != None):
+            self.fd = fileno()
+            self.reader = None
+        else:
+            self.reader = ReaderThread(self.interface)
+            self.fd = self.reader.fileno()
+            self.reader.start()
+        self.window = board._transport.window
+        self.operations = deque()
+        self.operation = None
+        self.batch = None
+        self.next = 0
+        self.inflight = deque()
+        self.late = 0 #Responses of abandoned commands still to arrive, no command is written until they have
+        self.results = []
+        self.error = None
+        self.responseTimer = None
+        self.pollTimer = None
+        self.pollQueued = False
+
+    def submit(self, generator, callback):
+        self.operations.append(_Operation(generator, callback))
+        if self.operation == None:
+            self._nextOperation()
+
+    def poll(self):
+        """
+        Queue a status poll unless one is already waiting
+        """
+        if self.pollTimer != None:
+            self.pollTimer.cancel()
+            self.pollTimer = None
+        if not self.pollQueued:
+            self.pollQueued = True
+            self.submit(_pollStatus(self), None)
+
+    def schedulePoll(self, snapshot):
+        if self.pollTimer != None:
+            self.pollTimer.cancel()
+            self.pollTimer = None
+        if self.pollQueued: #Polled again right away
+            return
+        if snapshot.connected or snapshot.ndefBusy:
+            interval = self.fastInterval
+        else:
+            interval = self.slowInterval
+        self.pollTimer = self.reactor._callLater(interval, self.poll)
+
+    def _nextOperation(self):
+        while (self.operation == None) and (len(self.operations) > 0):
+            self.operation = self.operations.popleft()
+            self._advance(None, None)
+
+    def _advance(self, results, error):
+        #Resume the current operation with the results (or the error) of its last batch
+        operation = self.operation
+        try:
+            if error != None:
+                batch = operation.generator.throw(error)
+            else:
+                batch = operation.generator.send(results)
+        except StopIteration as e:
+            self._complete(getattr(e, "value", None), None)
+            return
+        except Exception as e:
+            self._complete(None, e)
+            return
+        self._startBatch(batch)
+
+    def _complete(self, result, error):
+        operation = self.operation
+        self.operation = None
+        if operation.callback != None:
+            try:
+                operation.callback(result, error)
+            except Exception:
+                logging.exception("Operation callback failed")
+        elif error != None:
+            logging.error("Operation on board %s failed: %s", self.board.id, error)
+        if self.reactor._channels.get(self.fd) is self:
+            self._nextOperation()
+
+    def _startBatch(self, batch):
+        #Encode everything before the first write
+        self.batch = [(COMMANDS[descriptor[0]], COMMANDS[descriptor[0]].encode(descriptor[1:])) for descriptor in batch]
+        self.next = 0
+        self.results = []
+        self.error = None
+        self._pump()
+
+    def _pump(self):
+        if (self.late > 0) and (self.next < len(self.batch)) and (self.error == None):
+            #A late response would be taken for the response of a new command with the same code
+            self._waitLate()
+            return
+        while (self.next < len(self.batch)) and (len(self.inflight) < self.window) and (self.error == None):
+            command, report = self.batch[self.next]
+            self.next += 1
+            try:
+                self.interface.writeReport(report)
+            except Exception as e:
+                self.error = e
+                break
+            if self.reader != None:
+                self.reader.expect()
+            self.inflight.append((command, report))
+        if len(self.inflight) > 0:
+            timeout = self.board._transport.timeout
+            if (self.responseTimer == None) and (timeout != None):
+                self.responseTimer = self.reactor._callLater(timeout, self._timeout)
+            return
+        if self.responseTimer != None:
+            self.responseTimer.cancel()
+            self.responseTimer = None
+        if (self.next < len(self.batch)) and (self.error == None):
+            return
+        results, error = self.results, self.error
+        self.batch = self.results = self.error = None
+        self._advance(results, error)
+
+    def readable(self):
+        if self.reader != None:
+            for rx, error in self.reader.reports():
+                self._received(rx, error)
+            return
+        rx = bytearray(REPORT_SIZE)
+        try:
+            self.interface.readInto(rx)
+        except Exception as e:
+            self._received(None, e)
+            return
+        self._received(rx, None)
+
+    def _received(self, rx, error):
+        #Nothing is written while responses are late, so they arrive with no command in flight
+        if len(self.inflight) == 0:
+            if (error == None) and (self.late > 0):
+                self.late -= 1
+                if (self.late == 0) and (self.batch != None):
+                    self._cancelResponseTimer()
+                    self._pump()
+            elif error == None:
+                logging.warning("Unexpected report from board %s", self.board.id)
+            return
+        if (error == None) and (rx[0] != self.inflight[0][0].code):
+            #Unexpected report: the responses of the commands in flight may still come
+            self._abandon(ProtocolError('Device returned invalid command code %d' % rx[0]))
+            return
+        command, report = self.inflight.popleft()
+        self._cancelResponseTimer()
+        if (error == None) and (rx[1] != 0):
+            error = CommandError(rx[1])
+        if error != None:
+            if self.error == None:
+                self.error = error
+        elif self.error == None:
+            self.results.append(command.decode(report, memoryview(rx)))
+        self._pump()
+
+    def _timeout(self):
+        self.responseTimer = None
+        self._abandon(TimeoutError("No response from board %s" % (self.board.id,)))
+
+    def _abandon(self, error):
+        #Give up on the batch, the responses of the commands in flight are dropped when they arrive
+        self._cancelResponseTimer()
+        self.late += len(self.inflight)
+        self.inflight.clear()
+        self.next = len(self.batch)
+        if self.error == None:
+            self.error = error
+        self._pump()
+
+    def _waitLate(self):
+        #Fail the batch without writing anything if the late responses do not come within the timeout
+        timeout = self.board._transport.timeout
+        if (self.responseTimer == None) and (timeout != None):
+            self.responseTimer = self.reactor._callLater(timeout, self._lateTimeout)
+
+    def _lateTimeout(self):
+        self.responseTimer = None
+        self.next = len(self.batch)
+        if self.error == None:
+            self.error = TimeoutError("Still waiting for %d late responses from board %s" % (self.late, self.board.id))
+        self._pump()
+
+    def _cancelResponseTimer(self):
+        if self.responseTimer != None:
+            self.responseTimer.cancel()
+            self.responseTimer = None
+
+    def close(self):
+        """
+        Stop driving the board; returns the number of responses it still owes
+        """
+        if self.pollTimer != None:
+            self.pollTimer.cancel()
+        self._cancelResponseTimer()
+        late = self.late + len(self.inflight)
+        if self.reader != None:
+            late -= len([rx for rx, error in self.reader.close() if error == None])
+        self.inflight.clear()
+        operations = list(self.operations)
+        if self.operation != None:
+            operations.insert(0, self.operation)
+        self.operation = None
+        self.operations.clear()
+        for operation in operations:
+            operation.generator.close()
+            if operation.callback != None:
+                operation.callback(None, ValueError("Board %s removed from the reactor" % (self.board.id,)))
+        return late
+
+class Reactor(object):
+    """
+    Drives many boards from a single thread: every board's file descriptor (hidraw), or a pipe
+    fed by a reader thread for other backends, is waited on by one epoll (or select) loop,
+    and each board runs its operations as a non-blocking command state machine.
+    Operations complete by calling callback(result, exception) on the reactor thread; the
+    status of each added board is polled and its events are emitted to the listeners
+    registered with MicroNFCBoard.addEventListener().
+    All methods can be called from any thread.
+    """
+    def __init__(self, poller = None):
+        if poller == None:
+            poller = EpollPoller() if hasattr(select, "epoll") else SelectPoller()
+        self._poller = poller
+        self._channels = {}
+        self._boards = {}
+        self._timers = []
+        self._calls = deque()
+        self._running = False
+        self._wakeR, self._wakeW = _pipe()
+        self._poller.bind(self)
+        self._poller.register(self._wakeR)
+
+    def callSoon(self, func, *args):
+        """
+        Run func(*args) on the reactor thread
+        """
+        self._calls.append((func, args))
+        try:
+            os.write(self._wakeW, b"\0")
+        except OSError as e:
+            if e.errno != errno.EAGAIN: #The pipe is full of wake ups already
+                raise
+
+    def add(self, board, fastInterval = FAST_INTERVAL, slowInterval = SLOW_INTERVAL):
+        """
+        Drive an opened board, polling its status every fastInterval seconds while a tag is connected
+        or an operation is busy and every slowInterval seconds otherwise (0 to poll back to back).
+        Until removed, the board must only be used through the reactor.
+        """
+        board.stopEvents()
+        board._transport.flush()
+        self.callSoon(self._add, board, fastInterval, slowInterval)
+
+    def remove(self, board):
+        self.callSoon(self._remove, board)
+
+    def submit(self, board, commands, callback = None):
+        """
+        Run a list of commands such as ('NFC_GET_RECORD_INFO', recordNumber) back to back, like
+        Transport.executeBatch(); callback receives the list of their results
+        """
+        self.callSoon(self._submit, board, callback, _batch, commands)
+
+    def startPolling(self, board, readerWriter, emulator, p2p, callback = None):
+        self.callSoon(self._submit, board, callback, _startPolling, readerWriter, emulator, p2p)
+
+    def stopPolling(self, board, callback = None):
+        self.callSoon(self._submit, board, callback, _stopPolling)
+
+    def ndefRead(self, board, callback = None):
+        self.callSoon(self._submit, board, callback, _ndefRead)
+
+    def ndefWrite(self, board, callback = None):
+        self.callSoon(self._submit, board, callback, _ndefWrite)
+
+    def setLeds(self, board, led1, led2, callback = None):
+        self.callSoon(self._submit, board, callback, _batch, [('LEDS', led1, led2)])
+
+    def readMessage(self, board, callback):
+        """
+        Fetch the NDEF message present on the board; callback receives its list of records
+        """
+        self.callSoon(self._submit, board, callback, _readMessage)
+
+    def stageMessage(self, board, records, callback = None, progress = None):
+        """
+        Upload a list of records, or a CompiledMessage, to the board, skipping the upload if the board
+        still holds it; progress(done, total) is called with the number of data bytes sent.
+        Firmware with a different URI prefix table needs messages compiled before the board was added.
+        """
+        self.callSoon(self._submit, board, callback, _stageMessage, records, progress)
+
+    def run(self):
+        """
+        Run the loop on the calling thread until stop()
+        """
+        self._running = True
+        while self._running:
+            self.runOnce()
+
+    def runOnce(self, timeout = None):
+        """
+        Wait for reports or timers at most timeout seconds (or until the next timer) and process them
+        """
+        delay = self._runTimers()
+        if (delay == None) or ((timeout != None) and (timeout < delay)):
+            delay = timeout
+        for fd in self._poller.poll(delay):
+            self._ready(fd)
+        self._runTimers()
+
+    def stop(self):
+        self.callSoon(self._stop)
+
+    def close(self):
+        """
+        Release the reactor once stopped; boards are handed back for blocking use
+        """
+        for channel in self._boards.values():
+            if channel.reader != None:
+                channel.reader.stop() #Let every reader thread exit at once
+        for board in list(self._boards.keys()):
+            self._remove(board)
+        self._poller.unregister(self._wakeR)
+        self._poller.close()
+        os.close(self._wakeR)
+        os.close(self._wakeW)
+
+    def _stop(self):
+        self._running = False
+
+    def _ready(self, fd):
+        if fd == self._wakeR:
+            _drain(self._wakeR)
+            while len(self._calls) > 0:
+                func, args = self._calls.popleft()
+                try:
+                    func(*args)
+                except Exception:
+                    logging.exception("Reactor call failed")
+            return
+        channel = self._channels.get(fd)
+        if channel != None:
+            channel.readable()
+
+    def _callLater(self, delay, func, *args):
+        timer = _Timer(default_timer() + delay, func, args)
+        reschedule = (len(self._timers) == 0) or (timer.deadline < self._timers[0].deadline)
+        heappush(self._timers, timer)
+        if reschedule:
+            self._poller.reschedule(timer.deadline)
+        return timer
+
+    def _runTimers(self):
+        #Returns the delay until the next timer, or None
+        while len(self._timers) > 0:
+            now = default_timer()
+            timer = self._timers[0]
+            if timer.func == None:
+                heappop(self._timers)
+                continue
+            if timer.deadline > now:
+                return timer.deadline - now
+            heappop(self._timers)
+            func, timer.func = timer.func, None
+            try:
+                func(*timer.args)
+            except Exception:
+                logging.exception("Reactor timer failed")
+        return None
+
+    def _add(self, board, fastInterval, slowInterval):
+        if board in self._boards:
+            return
+        channel = _Channel(self, board, fastInterval, slowInterval)
+        self._channels[channel.fd] = channel
+        self._boards[board] = channel
+        self._poller.register(channel.fd)
+        board._events.reset()
+        channel.poll()
+
+    def _remove(self, board):
+        channel = self._boards.pop(board, None)
+        if channel == None:
+            return
+        del self._channels[channel.fd]
+        self._poller.unregister(channel.fd)
+        #The blocking API waits for the responses still owed before writing
+        board._transport._stale += channel.close()
+
+    def _submit(self, board, callback, operation, *args):
+        channel = self._boards.get(board)
+        if channel == None:
+            if callback != None:
+                callback(None, ValueError("Board %s is not driven by this reactor" % (board.id,)))
+            return
+        channel.submit(operation(channel, *args), callback)
+
+#Operations are generators yielding batches of command descriptors and receiving their results
+
+def _batch(channel, commands):
+    raise Return((yield commands))
+
+def _pollStatus(channel):
+    board = channel.board
+    channel.pollQueued = False
+    try:
+        status = (yield [('GET_STATUS',)])[0]
+    except Exception:
+        channel.schedulePoll(board._status)
+        raise
+    snapshot = board._setStatus(status)
+    board._events.update(snapshot)
+    channel.schedulePoll(snapshot)
+
+def _startPolling(channel, readerWriter, emulator, p2p):
+    channel.board._setEmulating(emulator or p2p)
+    yield [('NFC_POLL', readerWriter, emulator, p2p)]
+    channel.poll()
+
+def _stopPolling(channel):
+    channel.board._setEmulating(False)
+    yield [('NFC_POLL', False, False, False)]
+    channel.poll()
+
+def _ndefRead(channel):
+    channel.board._readStarted()
+    yield [('NFC_OPERATION', True, False)]
+    channel.poll()
+
+def _ndefWrite(channel):
+    #Marked pending before the operation is sent, as in MicroNFCBoard.ndefWrite()
+    events = channel.board._events
+    events.writeStarted()
+    try:
+        yield [('NFC_OPERATION', False, True)]
+    except Exception:
+        events.writeAborted()
+        raise
+    channel.poll()
+
+def _stageMessage(channel, records, progress):
+    board = channel.board
+    if not (isinstance(records, CompiledMessage) or board._localPrefixes):
+        raise ValueError("Board %s encodes URI prefixes remotely, compile the message before adding the board" % (board.id,))
+    message, upload = board._planUpload(records)
+    if upload:
+        for batch in board._uploadBatches(message, progress):
+            yield batch
+    channel.poll()
+
+def _readMessage(channel):
+    reader = channel.board._messageReader()
+    batches = reader.run()
+    results = None
+    while True:
+        try:
+            batch = batches.send(results)
+        except StopIteration:
+            break
+        results = yield batch
+    raise Return(reader.records)
@@ -0,0 +1,166 @@
+"""
+MicroNFCBoard Python API
+
+Copyright (c) 2014-2015 AppNearMe Ltd
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from timeit import default_timer
+
+SUB_BUCKET_BITS = 4 #16 linear sub-buckets per power of two, under 7% relative error
+
+class LatencyHistogram(object):
+    """
+    HDR-style histogram of latencies in microseconds: buckets are linear up to
+    2 ** (SUB_BUCKET_BITS + 1) then logarithmic, each power of two being split in linear sub-buckets
+    """
+    def __init__(self):
+        self.reset()
+        
+    def reset(self):
+        self._counts = []
+        self._count = 0
+        self._total = 0
+        self._max = 0
+        
+    @property
+    def count(self):
+        return self._count
+    
+    @property
+    def total(self):
+        return self._total
+    
+    @property
+    def max(self):
+        return self._max
+        
+    def record(self, value):
+        value = int(value)
+        index = _bucketIndex(value)
+        if index >= len(self._counts):
+            self._counts.extend([0] * (index + 1 - len(self._counts)))
+        self._counts[index] += 1
+        self._count += 1
+        self._total += value
+        if value > self._max:
+            self._max = value
+            
+    def percentile(self, percentile):
+        """
+        Returns the highest value equivalent to the percentile-th (0 to 100) recorded value
+        """
+        if self._count == 0:
+            return 0
+        rank = max(1, int(round(self._count * percentile / 100.0)))
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= rank:
+                return min(_bucketHighest(index), self._max)
+        return self._max
+
+def _bucketIndex(value):
+    if value < (2 << SUB_BUCKET_BITS):
+        return value
+    shift = value.bit_length() - (SUB_BUCKET_BITS + 1)
+    return (shift << SUB_BUCKET_BITS) + (value >> shift)
+
+def _bucketHighest(index):
+    if index < (2 << SUB_BUCKET_BITS):
+        return index
+    shift = (index >> SUB_BUCKET_BITS) - 1
+    return ((index - (shift << SUB_BUCKET_BITS) + 1) << shift) - 1
+
+class CommandStats(object):
+    def __init__(self):
+        self.calls = 0
+        self.responses = 0
+        self.bytesOut = 0
+        self.bytesIn = 0
+        self.errors = {}
+        self.latency = LatencyHistogram()
+
+class TransportStats(object):
+    """
+    Calls, errors, payload bytes and latency histogram per command code, filled by Transport when stats are enabled
+    Bytes count the parameters sent and the results received, not the padding of the fixed size reports
+    """
+    def __init__(self, names):
+        self._names = names
+        self._commands = {}
+        
+    def reset(self):
+        self._commands = {}
+        
+    def _command(self, code):
+        stats = self._commands.get(code)
+        if stats == None:
+            stats = self._commands[code] = CommandStats()
+        return stats
+        
+    def written(self, code, length):
+        """
+        Account for a command written with length bytes of parameters
+        """
+        self._command(code).bytesOut += length
+        
+    def record(self, code, sent, length):
+        """
+        Account for a response carrying length bytes of results to a command written at time sent (from timer())
+        """
+        stats = self._command(code)
+        stats.calls += 1
+        stats.responses += 1
+        stats.bytesIn += length
+        stats.latency.record((default_timer() - sent) * 1e6)
+        
+    def error(self, code, error, received):
+        """
+        Account for a command failing with error, received telling whether the board responded
+        """
+        stats = self._command(code)
+        stats.calls += 1
+        if received:
+            stats.responses += 1
+        kind = type(error).__name__
+        stats.errors[kind] = stats.errors.get(kind, 0) + 1
+        
+    def snapshot(self):
+        """
+        Returns a dict of totals and per command name statistics, latencies being in seconds
+        """
+        commands = {}
+        errors = {}
+        calls = 0
+        for code, stats in self._commands.items():
+            latency = stats.latency
+            commands[self._names.get(code, code)] = { 'calls': stats.calls,
+                                                      'errors': dict(stats.errors),
+                                                      'bytesOut': stats.bytesOut,
+                                                      'bytesIn': stats.bytesIn,
+                                                      'time': latency.total / 1e6,
+                                                      'p50': latency.percentile(50) / 1e6,
+                                                      'p99': latency.percentile(99) / 1e6,
+                                                      'max': latency.max / 1e6,
+                                                    }
+            calls += stats.calls
+            for kind, count in stats.errors.items():
+                errors[kind] = errors.get(kind, 0) + count
+        return { 'calls': calls,
+                 'errors': errors,
+                 'bytesOut': sum([command['bytesOut'] for command in commands.values()]),
+                 'bytesIn': sum([command['bytesIn'] for command in commands.values()]),
+                 'commands': commands,
+               }
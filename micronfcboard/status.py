@@ -0,0 +1,83 @@
+"""
+MicroNFCBoard Python API
+
+Copyright (c) 2014-2015 AppNearMe Ltd
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+STATUS_POLLING        = (1 << 0)
+STATUS_CONNECTED      = (1 << 1)
+STATUS_NDEF_PRESENT   = (1 << 2)
+STATUS_NDEF_READABLE  = (1 << 3)
+STATUS_NDEF_WRITEABLE = (1 << 4)
+STATUS_NDEF_BUSY      = (1 << 5)
+STATUS_NDEF_SUCCESS   = (1 << 6)
+
+STATUS_TYPE_MASK      = (0xFF << 8)
+STATUS_TYPE1          = (1 << 8)
+STATUS_TYPE2          = (2 << 8)
+STATUS_TYPE3          = (3 << 8)
+STATUS_TYPE4          = (4 << 8)
+STATUS_P2P            = (8 << 8)
+
+STATUS_INITIATOR      = (1 << 16)
+STATUS_TARGET         = (0 << 16)
+
+class StatusSnapshot(object):
+    """
+    Immutable view of one status word returned by GET_STATUS
+    """
+    __slots__ = ('status', 'polling', 'connected', 'ndefPresent', 'ndefReadable', 'ndefWriteable',
+                 'ndefBusy', 'ndefSuccess', 'type2', 'type4', 'p2p', 'initiator')
+    
+    def __init__(self, status):
+        setattr = super(StatusSnapshot, self).__setattr__
+        setattr('status', status)
+        setattr('polling', (status & STATUS_POLLING) != 0)
+        setattr('connected', (status & STATUS_CONNECTED) != 0)
+        setattr('ndefPresent', (status & STATUS_NDEF_PRESENT) != 0)
+        setattr('ndefReadable', (status & STATUS_NDEF_READABLE) != 0)
+        setattr('ndefWriteable', (status & STATUS_NDEF_WRITEABLE) != 0)
+        setattr('ndefBusy', (status & STATUS_NDEF_BUSY) != 0)
+        setattr('ndefSuccess', (status & STATUS_NDEF_SUCCESS) != 0)
+        setattr('type2', (status & STATUS_TYPE_MASK) == STATUS_TYPE2)
+        setattr('type4', (status & STATUS_TYPE_MASK) == STATUS_TYPE4)
+        setattr('p2p', (status & STATUS_TYPE_MASK) == STATUS_P2P)
+        setattr('initiator', (status & STATUS_INITIATOR) != 0)
+        
+    def __setattr__(self, name, value):
+        raise AttributeError("StatusSnapshot is immutable")
+    
+    def __delattr__(self, name):
+        raise AttributeError("StatusSnapshot is immutable")
+    
+    @property
+    def type2Tag(self):
+        return self.type2 and self.initiator
+    
+    @property
+    def type4Emulator(self):
+        return self.type4 and not self.initiator
+    
+    def __eq__(self, other):
+        return isinstance(other, StatusSnapshot) and (self.status == other.status)
+    
+    def __ne__(self, other):
+        return not self.__eq__(other)
+    
+    def __hash__(self):
+        return hash(self.status)
+    
+    def __repr__(self):
+        return "StatusSnapshot(0x%08X)" % (self.status,)
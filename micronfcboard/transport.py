@@ -16,8 +16,16 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-from struct import pack, unpack
-from array import array
+from struct import Struct
+from collections import deque
+from binascii import hexlify
+from threading import Lock, local
+from thread import get_ident
+from timeit import default_timer
+from contextlib import contextmanager
+import errno
+
+from stats import TransportStats
 
 COMMAND_ID = { 'GET_STATUS': 0x00, 'INFO': 0x01, 'RESET': 0x02, 'LEDS': 0x03,
                 'NFC_POLL': 0x04, 'NFC_OPERATION': 0x05, 'NFC_GET_INFO': 0x06, 
@@ -26,210 +34,575 @@ COMMAND_ID = { 'GET_STATUS': 0x00, 'INFO': 0x01, 'RESET': 0x02, 'LEDS': 0x03,
                 'NFC_PREPARE_MESSAGE': 0x0D,
                 'NFC_DECODE_PREFIX': 0x0E, 'NFC_ENCODE_PREFIX': 0x0F,
                }
+COMMAND_NAME = dict([(code, name) for name, code in COMMAND_ID.items()])
+
+# Oldest firmware that accepts several commands in flight
+PIPELINE_FIRMWARE = (1, 5)
+
+# Most commands in flight; with as many late responses, the reports waiting to be read
+# stay within interface.report_queue.REPORT_QUEUE_SIZE
+MAX_WINDOW = 32
+
+REPORT_SIZE = 64
+
+# Seconds to wait for a response before giving up on a command (None to wait forever)
+RESPONSE_TIMEOUT = 1.0
 
+# Requests are written as HID reports: report ID, command code, parameters
+REPORT_CODE = 1
+REPORT_PARAMS = 2
     
 class BoardError(ValueError):
     pass
 
+class ProtocolError(BoardError):
+    """
+    The response does not match the command sent
+    """
+    pass
+
+class CommandError(BoardError):
+    """
+    The board rejected the command with a non-zero status
+    """
+    def __init__(self, status):
+        super(CommandError, self).__init__('Device returned %d' % status)
+        self.status = status
+
+class TimeoutError(BoardError):
+    """
+    No response came before the timeout or deadline expired
+    """
+    pass
+
+class _Deadline(local):
+    deadline = None #Per thread, in default_timer() time
+
+_EMPTY_REPORT = bytes(bytearray(REPORT_SIZE + 1))
+
+class Command(object):
+    """
+    Wire format of a command, compiled once at import: parameters are packed with
+    the request structure after the command code, results are unpacked with the
+    response structure after the command code and status bytes.
+    Commands with variable length parts provide their own encoder/decoder, and functions
+    returning the length of the parameters or results they carry for statistics.
+    Decoders may return views on the response buffer (view = True): batches give each
+    command its own buffer, the generated Transport methods return a copy.
+    """
+    def __init__(self, name, method, request = "", response = "", encoder = None, decoder = None, posted = False,
+                 requestLength = None, responseLength = None, view = False):
+        self.name = name
+        self.method = method
+        self.code = COMMAND_ID[name]
+        self.request = Struct(">" + request)
+        self.response = Struct(">" + response)
+        self.posted = posted #Only returns a status, can be pipelined
+        self.view = view #Decoded as a view on the response buffer
+        self._encoder = encoder
+        self._decoder = decoder
+        self._requestLength = requestLength
+        self._responseLength = responseLength
+        self._fields = len(self.response.unpack_from(bytearray(REPORT_SIZE)))
+        
+    def encode(self, args, report = None):
+        if report == None:
+            report = bytearray(REPORT_SIZE + 1)
+        else:
+            report[:] = _EMPTY_REPORT
+        report[REPORT_CODE] = self.code
+        if self._encoder != None:
+            self._encoder(self, report, *args)
+        else:
+            self.request.pack_into(report, REPORT_PARAMS, *args)
+        return report
+    
+    def decode(self, cmd, resp):
+        if self._decoder != None:
+            return self._decoder(self, cmd, resp)
+        if self._fields == 0:
+            return None
+        values = self.response.unpack_from(resp, 2)
+        if self._fields == 1:
+            return values[0]
+        return values
+    
+    def requestLength(self, cmd):
+        """
+        Number of parameter bytes carried by request report cmd
+        """
+        if self._requestLength != None:
+            return self._requestLength(self, cmd)
+        return self.request.size
+    
+    def responseLength(self, cmd, resp):
+        """
+        Number of result bytes carried by response report resp to request cmd
+        """
+        if self._responseLength != None:
+            return self._responseLength(self, cmd, resp)
+        return self.response.size
+
 class Transport(object):
-    def __init__(self):
+    def __init__(self, window = 1):
         self.interface = None
+        self._window = min(max(1, window), MAX_WINDOW)
+        self._firmware = None
+        self._pending = deque() #Posted commands with the thread that posted them
+        self._postedErrors = {} #First error of a posted command, by the thread that posted it
+        self._lock = Lock() #Serializes callers from several threads
+        self._tx = bytearray(REPORT_SIZE + 1)
+        self._rx = bytearray(REPORT_SIZE)
+        self._rxView = memoryview(self._rx)
+        self._pendingRx = bytearray(REPORT_SIZE)
+        self._statusReport = _GET_STATUS.encode(())
+        self._statusRx = bytearray(REPORT_SIZE)
+        self._stats = None
+        self._timeout = RESPONSE_TIMEOUT
+        self._timeoutMs = _milliseconds(RESPONSE_TIMEOUT)
+        self._deadline = _Deadline()
+        self._stale = 0 #Responses of timed out commands that may still arrive
+        self._drainRx = bytearray(REPORT_SIZE)
 
     def open(self, interface):
         self.interface = interface
+        self._firmware = None
+        self._pending.clear()
+        self._postedErrors.clear()
+        self._stale = 0
         self.interface.init()
 
     def close(self):
         self.interface.close()
         
-    def reset(self, isp=False):
-        cmd = [ COMMAND_ID['RESET'] ]
-        if(isp):
-            cmd.append(1)
-        else:
-            cmd.append(0)
-        self.interface.write(cmd)
-         
-    def status(self):
-        cmd = [ COMMAND_ID['GET_STATUS'] ]
-        self.interface.write(cmd)
-        resp = array('B', self.interface.read())
-        if (resp[0] != COMMAND_ID['GET_STATUS']):
-            raise BoardError('Device returned invalid command code %d' % resp[0])
-        if resp[1] != 0:
-            raise BoardError('Device returned %d' % resp[1])
-        return unpack(">I", resp[2:6])[0]
-         
-    def nfcPoll(self, readerWriter, emulator, p2p):
-        cmd = [ COMMAND_ID['NFC_POLL'] ]
-        modes = 0
-        if(readerWriter):
-            modes |= 1
-        if(emulator):
-            modes |= 2
-        if(p2p):
-            modes |= 4
-        cmd.append(modes)
-        self.interface.write(cmd)
-        resp = array('B', self.interface.read())
-        if (resp[0] != COMMAND_ID['NFC_POLL']):
-            raise BoardError('Device returned invalid command code %d' % resp[0])
-        if resp[1] != 0:
-            raise BoardError('Device returned %d' % resp[1])
-
-    def nfcOperation(self, readOp, writeOp):
-        cmd = [ COMMAND_ID['NFC_OPERATION'] ]
-        if(readOp):
-            cmd.append(1)
-        elif(writeOp):
-            cmd.append(2)
-        else:
-            cmd.append(0)
-        self.interface.write(cmd)
-        resp = array('B', self.interface.read())
-        if (resp[0] != COMMAND_ID['NFC_OPERATION']):
-            raise BoardError('Device returned invalid command code %d' % resp[0])
-        if resp[1] != 0:
-            raise BoardError('Device returned %d' % resp[1])
-
-    def nfcGetInfo(self):
-        cmd = [ COMMAND_ID['NFC_GET_INFO'] ]
-        self.interface.write(cmd)
-        resp = array('B', self.interface.read())
-        if (resp[0] != COMMAND_ID['NFC_GET_INFO']):
-            raise BoardError('Device returned invalid command code %d' % resp[0])
-        if resp[1] != 0:
-            raise BoardError('Device returned %d' % resp[1])
-        atqa = "".join([ "%02X" % b for b in resp[2:4]] )
-        sak = "%02X" % (resp[4],)
-        uidLength = resp[5]
-        uid = "".join([ "%02X" % b for b in resp[6:6+uidLength]] )
-        return atqa, sak, uid
-        
-    def nfcGetMessageInfo(self):
-        cmd = [ COMMAND_ID['NFC_GET_MESSAGE_INFO'] ]
-        self.interface.write(cmd)
-        resp = array('B', self.interface.read())
-        if (resp[0] != COMMAND_ID['NFC_GET_MESSAGE_INFO']):
-            raise BoardError('Device returned invalid command code %d' % resp[0])
-        if resp[1] != 0:
-            raise BoardError('Device returned %d' % resp[1])
-        return unpack(">H", resp[2:4])[0]
+    @property
+    def window(self):
+        """
+        Number of commands that can be in flight, 1 meaning lock-step
+        """
+        if (self._firmware == None) or (self._firmware < PIPELINE_FIRMWARE):
+            return 1
+        return self._window
     
-    def nfcSetMessageInfo(self, recordCount):
-        cmd = [ COMMAND_ID['NFC_SET_MESSAGE_INFO'] ]
-        cmd += array('B', pack(">H", recordCount))
-        self.interface.write(cmd)
-        resp = array('B', self.interface.read())
-        if (resp[0] != COMMAND_ID['NFC_SET_MESSAGE_INFO']):
-            raise BoardError('Device returned invalid command code %d' % resp[0])
-        if resp[1] != 0:
-            raise BoardError('Device returned %d' % resp[1])
+    @property
+    def timeout(self):
+        return self._timeout
     
-    def nfcGetRecordInfo(self, recordNumber):
-        cmd = [ COMMAND_ID['NFC_GET_RECORD_INFO'] ]
-        cmd += array('B', pack(">H", recordNumber))
-        self.interface.write(cmd)
-        resp = array('B', self.interface.read())
-        if (resp[0] != COMMAND_ID['NFC_GET_RECORD_INFO']):
-            raise BoardError('Device returned invalid command code %d' % resp[0])
-        if resp[1] != 0:
-            raise BoardError('Device returned %d' % resp[1])
-        recordType = unpack(">H", resp[2:4])[0]
-        recordInfo = [unpack(">H", resp[x:x+2])[0] for x in range(4,len(resp),2)]
-        return recordType, recordInfo
+    def setTimeout(self, timeout):
+        """
+        Wait at most timeout seconds for each response (None to wait forever)
+        """
+        self._timeout = timeout
+        self._timeoutMs = _milliseconds(timeout)
+        
+    @contextmanager
+    def deadline(self, timeout):
+        """
+        Context manager failing the commands of the calling thread with a TimeoutError once
+        timeout seconds have elapsed; nested deadlines can only shorten the enclosing one
+        """
+        previous = self._deadline.deadline
+        deadline = default_timer() + timeout
+        if (previous != None) and (previous < deadline):
+            deadline = previous
+        self._deadline.deadline = deadline
+        try:
+            yield
+        finally:
+            self._deadline.deadline = previous
+        
+    def _readTimeout(self):
+        # Milliseconds the interface may wait for the next report, -1 to block
+        deadline = self._deadline.deadline
+        if deadline == None:
+            return self._timeoutMs
+        remaining = _milliseconds(deadline - default_timer()) #0 once expired: only take a response already there
+        if (self._timeoutMs >= 0) and (self._timeoutMs < remaining):
+            return self._timeoutMs
+        return remaining
+        
+    def setWindow(self, window):
+        with self._lock:
+            self._flush()
+            self._window = min(max(1, window), MAX_WINDOW)
+        
+    def enableStats(self, enabled = True):
+        """
+        Start or stop collecting per command statistics
+        """
+        with self._lock:
+            self._flush()
+            if not enabled:
+                self._stats = None
+            elif self._stats == None:
+                self._stats = TransportStats(COMMAND_NAME)
+            
+    def stats(self):
+        """
+        Returns a dict snapshot of the statistics, or None if they are not enabled
+        """
+        with self._lock:
+            if self._stats == None:
+                return None
+            return self._stats.snapshot()
+        
+    def resetStats(self):
+        with self._lock:
+            if self._stats != None:
+                self._stats.reset()
+        
+    def _sent(self, cmd):
+        # Time a command is written at, only needed for statistics
+        if self._stats == None:
+            return 0
+        code = cmd[REPORT_CODE]
+        self._stats.written(code, _COMMAND_BY_CODE[code].requestLength(cmd))
+        return default_timer()
+        
+    def flush(self):
+        """
+        Collect the responses of all pipelined commands, raising the first error of
+        the commands the calling thread posted; errors of commands posted by other
+        threads are kept for those threads, and only timeouts concern every caller
+        """
+        with self._lock:
+            self._flush()
+        
+    def _flush(self):
+        if self._stale > 0:
+            self._resync()
+        while len(self._pending) > 0:
+            self._collectPosted()
+        error = self._postedErrors.pop(get_ident(), None)
+        if error != None:
+            raise error
+        
+    def _collectPosted(self):
+        # Check the oldest posted command, keeping its error for the thread that posted it
+        commandCode, rx, sent, owner = self._pending.popleft()
+        try:
+            self._response(commandCode, rx, sent)
+        except TimeoutError:
+            self._abandon(self._pending)
+            raise
+        except BoardError as e:
+            self._postedErrors.setdefault(owner, e)
+        
+    def _abandon(self, inflight):
+        # The responses of commands written after one that timed out are late as well
+        self._stale += len(inflight)
+        inflight.clear()
+        
+    def _resync(self):
+        # Wait for the late responses before writing new commands, as a late response
+        # would be taken for the response of a new command with the same code;
+        # while some are still missing nothing is written and the call times out,
+        # until they arrive or the transport is opened again
+        timeout = self._timeoutMs if self._timeoutMs >= 0 else _milliseconds(RESPONSE_TIMEOUT)
+        if self._deadline.deadline != None:
+            timeout = min(timeout, self._readTimeout())
+        while self._stale > 0:
+            try:
+                self.interface.readInto(self._drainRx, timeout)
+            except IOError as e:
+                if e.errno != errno.ETIMEDOUT:
+                    raise
+                raise TimeoutError('Still waiting for %d late responses from the board' % self._stale)
+            self._stale -= 1
+        
+    def _response(self, commandCode, rx, sent = 0, cmd = None):
+        # The report is read in place, results are decoded from views on rx;
+        # cmd is only needed by statistics, and can be None for posted commands
+        if self._stats != None:
+            self._measuredResponse(commandCode, rx, sent, cmd)
+            return
+        self._receive(commandCode, rx)
+        if rx[1] != 0:
+            raise CommandError(rx[1])
+        
+    def _read(self, rx):
+        try:
+            self.interface.readInto(rx, self._readTimeout())
+        except IOError as e:
+            if e.errno != errno.ETIMEDOUT:
+                raise
+            self._stale += 1
+            raise TimeoutError('No response from the board')
+        
+    def _receive(self, commandCode, rx):
+        # Late responses are all collected by _resync() before a command is written,
+        # so the first report read answers the oldest command in flight
+        self._read(rx)
+        if rx[0] == commandCode:
+            return
+        #Unexpected report: drop everything until the link is quiet, this command's response included
+        self._drain()
+        raise ProtocolError('Device returned invalid command code %d' % rx[0])
+        
+    def _drain(self):
+        timeout = self._timeoutMs if self._timeoutMs >= 0 else _milliseconds(RESPONSE_TIMEOUT)
+        while True:
+            try:
+                self.interface.readInto(self._drainRx, timeout)
+            except IOError as e:
+                if e.errno != errno.ETIMEDOUT:
+                    raise
+                return
+        
+    def _measuredResponse(self, commandCode, rx, sent, cmd):
+        try:
+            self._receive(commandCode, rx)
+        except ProtocolError as e:
+            self._stats.error(commandCode, e, True)
+            raise
+        except Exception as e:
+            self._stats.error(commandCode, e, False)
+            raise
+        if rx[1] != 0:
+            e = CommandError(rx[1])
+            self._stats.error(commandCode, e, True)
+            raise e
+        self._stats.record(commandCode, sent, _COMMAND_BY_CODE[commandCode].responseLength(cmd, rx))
     
-    def nfcSetRecordInfo(self, recordNumber, recordType, recordInfo):
-        cmd = [ COMMAND_ID['NFC_SET_RECORD_INFO'] ]
-        cmd += array('B', pack(">HH", recordNumber, recordType))
-        for recordInfoItem in recordInfo:
-            cmd += array('B', pack(">H", recordInfoItem))
-        self.interface.write(cmd)
-        resp = array('B', self.interface.read())
-        if (resp[0] != COMMAND_ID['NFC_SET_RECORD_INFO']):
-            raise BoardError('Device returned invalid command code %d' % resp[0])
-        if resp[1] != 0:
-            raise BoardError('Device returned %d' % resp[1])
-        
-    def nfcGetRecordData(self, recordNumber, item, offset, length):
-        cmd = [ COMMAND_ID['NFC_GET_RECORD_DATA'] ]
-        cmd += array('B', pack(">HBHH", recordNumber, item, offset, length))
-        self.interface.write(cmd)
-        resp = array('B', self.interface.read())
-        if (resp[0] != COMMAND_ID['NFC_GET_RECORD_DATA']):
-            raise BoardError('Device returned invalid command code %d' % resp[0])
-        if resp[1] != 0:
-            raise BoardError('Device returned %d' % resp[1])
-        return resp[2:2+length]
+    def _transfer(self, cmd):
+        self._flush()
+        sent = self._sent(cmd)
+        self.interface.writeReport(cmd)
+        self._response(cmd[REPORT_CODE], self._rx, sent, cmd)
+        return self._rxView
     
-    def nfcSetRecordData(self, recordNumber, item, offset, data):
-        cmd = [ COMMAND_ID['NFC_SET_RECORD_DATA'] ]
-        cmd += array('B', pack(">HBHH", recordNumber, item, offset, len(data)))
-        cmd += array('B', data)
-        self.interface.write(cmd)
-        resp = array('B', self.interface.read())
-        if (resp[0] != COMMAND_ID['NFC_SET_RECORD_DATA']):
-            raise BoardError('Device returned invalid command code %d' % resp[0])
-        if resp[1] != 0:
-            raise BoardError('Device returned %d' % resp[1])
+    def _post(self, cmd):
+        # Commands posted this way only return a status, which is checked when the window
+        # is full or on the next flush(); an error is raised by the next call of the posting thread
+        window = self.window
+        if window == 1:
+            self._transfer(cmd)
+            return
+        if self._stale > 0:
+            self._resync()
+        if len(self._pending) >= window:
+            self._collectPosted()
+            error = self._postedErrors.pop(get_ident(), None)
+            if error != None:
+                raise error
+        sent = self._sent(cmd)
+        self.interface.writeReport(cmd)
+        self._pending.append((cmd[REPORT_CODE], self._pendingRx, sent, get_ident()))
     
-    def nfcPrepareMessage(self, lock, generate):
-        cmd = [ COMMAND_ID['NFC_PREPARE_MESSAGE'] ]
-        if(lock):
-            cmd.append(1)
-        elif(generate):
-            cmd.append(2)
-        else:
-            cmd.append(0)
-        self.interface.write(cmd)
-        resp = array('B', self.interface.read())
-        if (resp[0] != COMMAND_ID['NFC_PREPARE_MESSAGE']):
-            raise BoardError('Device returned invalid command code %d' % resp[0])
-        if resp[1] != 0:
-            raise BoardError('Device returned %d' % resp[1])
-        
-    def nfcDecodePrefix(self, prefix):
-        cmd = [ COMMAND_ID['NFC_DECODE_PREFIX'] ]
-        cmd += array('B', pack(">B", prefix))
-        self.interface.write(cmd)
-        resp = array('B', self.interface.read())
-        if (resp[0] != COMMAND_ID['NFC_DECODE_PREFIX']):
-            raise BoardError('Device returned invalid command code %d' % resp[0])
-        if resp[1] != 0:
-            raise BoardError('Device returned %d' % resp[1])
-        length = unpack(">H", resp[2:4])[0]
-        return resp[4:4+length]
+    def _execute(self, command, args):
+        cmd = command.encode(args, self._tx)
+        if command.posted:
+            self._post(cmd)
+            return None
+        return command.decode(cmd, self._transfer(cmd))
+    
+    def execute(self, name, args, before = None):
+        """
+        Send command name with a tuple of args, returning its result; before() is called under
+        the transport lock right before the command is written, so that commands sent from
+        other threads (such as status polls) are ordered either before it or after the command
+        """
+        with self._lock:
+            if before != None:
+                before()
+            return self._execute(COMMANDS[name], args)
+        
+    def executeBatch(self, commands):
+        """
+        Run a list of commands such as ('NFC_GET_RECORD_INFO', recordNumber) back to back,
+        returning the list of their results or raising the first error.
+        Each command gets its own response buffer, so that returned views stay valid.
+        """
+        #Encode everything before the first transfer
+        reports = []
+        for descriptor in commands:
+            command = COMMANDS[descriptor[0]]
+            reports.append((command.encode(descriptor[1:]), command, bytearray(REPORT_SIZE)))
+        
+        with self._lock:
+            return self._executeBatch(reports)
+        
+    def _executeBatch(self, reports):
+        self._flush()
+        window = self.window
+        inflight = deque()
+        results = []
+        error = None
+        for report in reports:
+            if len(inflight) >= window:
+                error = self._collect(inflight, results)
+                if error != None:
+                    break
+            sent = self._sent(report[0])
+            self.interface.writeReport(report[0])
+            inflight.append(report + (sent,))
+        while len(inflight) > 0:
+            e = self._collect(inflight, results)
+            if error == None:
+                error = e
+        if error != None:
+            raise error
+        return results
     
-    def nfcEncodePrefix(self, data):
-        cmd = [ COMMAND_ID['NFC_ENCODE_PREFIX'] ]
-        cmd += array('B', pack(">H", len(data)))
-        cmd += array('B', data)
-        self.interface.write(cmd)
-        resp = array('B', self.interface.read())
-        if (resp[0] != COMMAND_ID['NFC_ENCODE_PREFIX']):
-            raise BoardError('Device returned invalid command code %d' % resp[0])
-        if resp[1] != 0:
-            raise BoardError('Device returned %d' % resp[1])
-        prefix, length = unpack(">BH", resp[2:5])
-        return prefix, length
+    def _collect(self, inflight, results):
+        cmd, command, rx, sent = inflight.popleft()
+        try:
+            self._response(command.code, rx, sent, cmd)
+            results.append(command.decode(cmd, memoryview(rx)))
+        except TimeoutError as e:
+            self._abandon(inflight)
+            return e
+        except BoardError as e:
+            return e
+        return None
+        
+    def reset(self, isp=False):
+        with self._lock:
+            self._flush()
+            self.interface.writeReport(COMMANDS['RESET'].encode((1 if isp else 0,), self._tx))
+         
+    def status(self):
+        # Hot path: prebuilt request, status word decoded in place from its own receive
+        # buffer so that polling from another thread leaves views on self._rx intact.
+        # The flush only raises errors of commands posted by the polling thread itself,
+        # pollers cannot rely on status() to report the errors of other threads' writes
+        with self._lock:
+            self._flush()
+            sent = self._sent(self._statusReport) if self._stats != None else 0
+            self.interface.writeReport(self._statusReport)
+            self._response(_GET_STATUS.code, self._statusRx, sent, self._statusReport)
+            return _GET_STATUS.response.unpack_from(self._statusRx, 2)[0]
         
     def info(self):
-        cmd = [ COMMAND_ID['INFO'] ]
-        self.interface.write(cmd)
-        resp = array('B', self.interface.read())
-        if (resp[0] != COMMAND_ID['INFO']):
-            raise BoardError('Device returned invalid command code %d' % resp[0])
-        if resp[1] != 0:
-            raise BoardError('Device returned %d' % resp[1])
-        version, revision = unpack(">HH", resp[2:6])
-        return version, revision, "".join([ "%02X" % b for b in resp[6:6+5*4]] )
-            
-    def leds(self, led1, led2):
-        cmd = [ COMMAND_ID['LEDS'] ]
-        cmd += [ 1 if led1 == True else 0, 1 if led2 == True else 0 ]
-        self.interface.write(cmd)
-        resp = array('B', self.interface.read())
-        if (resp[0] != COMMAND_ID['LEDS']):
-            raise BoardError('Device returned invalid command code %d' % resp[0])
-        if resp[1] != 0:
-            raise BoardError('Device returned %d' % resp[1])
+        with self._lock:
+            version, revision, boardId = self._execute(COMMANDS['INFO'], ())
+            self._firmware = (version, revision)
+        return version, revision, boardId
+
+def _milliseconds(timeout):
+    if timeout == None:
+        return -1
+    return max(0, int(timeout * 1000 + 0.999))
+
+def _hex(data):
+    return hexlify(data).upper()
+
+def _encodeModes(command, report, readerWriter, emulator, p2p):
+    modes = 0
+    if(readerWriter):
+        modes |= 1
+    if(emulator):
+        modes |= 2
+    if(p2p):
+        modes |= 4
+    command.request.pack_into(report, REPORT_PARAMS, modes)
+
+def _encodeOperation(command, report, first, second):
+    if(first):
+        command.request.pack_into(report, REPORT_PARAMS, 1)
+    elif(second):
+        command.request.pack_into(report, REPORT_PARAMS, 2)
+    else:
+        command.request.pack_into(report, REPORT_PARAMS, 0)
+
+def _encodeLeds(command, report, led1, led2):
+    command.request.pack_into(report, REPORT_PARAMS, 1 if led1 == True else 0, 1 if led2 == True else 0)
+
+def _decodeNfcGetInfo(command, cmd, resp):
+    sak, uidLength = command.response.unpack_from(resp, 2)
+    return _hex(resp[2:4]), _hex(resp[4:5]), _hex(resp[6:6+uidLength])
+
+def _nfcGetInfoLength(command, cmd, resp):
+    return command.response.size + command.response.unpack_from(resp, 2)[1]
+
+def _decodeNfcGetRecordInfo(command, cmd, resp):
+    values = command.response.unpack_from(resp, 2)
+    return values[0], list(values[1:])
+
+_RECORD_INFO = [Struct(">%dH" % count) for count in range((REPORT_SIZE - 5) // 2 + 1)]
+
+# Record info fields read by the firmware, per record type
+_RECORD_INFO_FIELDS = { 0: 0, 1: 2, 2: 3, 3: 2, 4: 2 }
+
+def _encodeNfcSetRecordInfo(command, report, recordNumber, recordType, recordInfo):
+    command.request.pack_into(report, REPORT_PARAMS, recordNumber, recordType)
+    _RECORD_INFO[len(recordInfo)].pack_into(report, REPORT_PARAMS + command.request.size, *recordInfo)
+
+def _nfcSetRecordInfoLength(command, cmd):
+    recordType = command.request.unpack_from(cmd, REPORT_PARAMS)[1]
+    return command.request.size + 2 * _RECORD_INFO_FIELDS.get(recordType, 0)
+
+def _decodeNfcGetRecordData(command, cmd, resp):
+    #View on the response buffer, only valid until the next command on it
+    length = command.request.unpack_from(cmd, REPORT_PARAMS)[3]
+    return resp[2:2+length]
+
+def _nfcGetRecordDataLength(command, cmd, resp):
+    return command.request.unpack_from(cmd, REPORT_PARAMS)[3]
+
+def _dataLength(command, cmd):
+    #Requests followed by as many data bytes as their last parameter
+    return command.request.size + command.request.unpack_from(cmd, REPORT_PARAMS)[-1]
+
+def _encodeNfcSetRecordData(command, report, recordNumber, item, offset, data):
+    command.request.pack_into(report, REPORT_PARAMS, recordNumber, item, offset, len(data))
+    report[REPORT_PARAMS+command.request.size:REPORT_PARAMS+command.request.size+len(data)] = data
+
+def _decodeNfcDecodePrefix(command, cmd, resp):
+    length = command.response.unpack_from(resp, 2)[0]
+    return resp[4:4+length]
+
+def _nfcDecodePrefixLength(command, cmd, resp):
+    return command.response.size + command.response.unpack_from(resp, 2)[0]
+
+def _encodeNfcEncodePrefix(command, report, data):
+    command.request.pack_into(report, REPORT_PARAMS, len(data))
+    report[REPORT_PARAMS+command.request.size:REPORT_PARAMS+command.request.size+len(data)] = data
+
+def _decodeInfo(command, cmd, resp):
+    version, revision = command.response.unpack_from(resp, 2)
+    return version, revision, _hex(resp[6:6+5*4])
+
+def _infoLength(command, cmd, resp):
+    return command.response.size + 5*4
+
+COMMANDS = dict([ (command.name, command) for command in [
+    Command('GET_STATUS', None, response = "I"),
+    Command('INFO', None, response = "HH", decoder = _decodeInfo, responseLength = _infoLength),
+    Command('RESET', None, request = "B"),
+    Command('LEDS', 'leds', request = "BB", encoder = _encodeLeds),
+    Command('NFC_POLL', 'nfcPoll', request = "B", encoder = _encodeModes),
+    Command('NFC_OPERATION', 'nfcOperation', request = "B", encoder = _encodeOperation),
+    Command('NFC_GET_INFO', 'nfcGetInfo', response = "2xBB", decoder = _decodeNfcGetInfo, responseLength = _nfcGetInfoLength),
+    Command('NFC_GET_MESSAGE_INFO', 'nfcGetMessageInfo', response = "H"),
+    Command('NFC_GET_RECORD_INFO', 'nfcGetRecordInfo', request = "H", response = "H30H", decoder = _decodeNfcGetRecordInfo),
+    Command('NFC_GET_RECORD_DATA', 'nfcGetRecordData', request = "HBHH", decoder = _decodeNfcGetRecordData, responseLength = _nfcGetRecordDataLength, view = True),
+    Command('NFC_SET_MESSAGE_INFO', 'nfcSetMessageInfo', request = "H", posted = True),
+    Command('NFC_SET_RECORD_INFO', 'nfcSetRecordInfo', request = "HH", encoder = _encodeNfcSetRecordInfo, posted = True, requestLength = _nfcSetRecordInfoLength),
+    Command('NFC_SET_RECORD_DATA', 'nfcSetRecordData', request = "HBHH", encoder = _encodeNfcSetRecordData, posted = True, requestLength = _dataLength),
+    Command('NFC_PREPARE_MESSAGE', 'nfcPrepareMessage', request = "B", encoder = _encodeOperation, posted = True),
+    Command('NFC_DECODE_PREFIX', 'nfcDecodePrefix', request = "B", response = "H", decoder = _decodeNfcDecodePrefix, responseLength = _nfcDecodePrefixLength, view = True),
+    Command('NFC_ENCODE_PREFIX', 'nfcEncodePrefix', request = "H", response = "BH", encoder = _encodeNfcEncodePrefix, requestLength = _dataLength),
+    ] ])
+
+def _method(command):
+    if command.view:
+        def method(self, *args):
+            #Copied under the lock, before another call reuses the response buffer
+            with self._lock:
+                return bytearray(self._execute(command, args))
+    else:
+        def method(self, *args):
+            with self._lock:
+                return self._execute(command, args)
+    method.__name__ = command.method
+    method.__doc__ = "Send the %s command" % (command.name,)
+    return method
+
+_GET_STATUS = COMMANDS['GET_STATUS']
+_COMMAND_BY_CODE = dict([(command.code, command) for command in COMMANDS.values()])
+
+# Generate Transport.nfcPoll(readerWriter, emulator, p2p), Transport.leds(led1, led2), ...
+for _command in COMMANDS.values():
+    if _command.method != None:
+        setattr(Transport, _command.method, _method(_command))
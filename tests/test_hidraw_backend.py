@@ -0,0 +1,104 @@
+"""
+MicroNFCBoard Python API
+
+Copyright (c) 2014-2015 AppNearMe Ltd
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import errno, socket, time, unittest
+from threading import Thread
+from timeit import default_timer
+from micronfcboard.interface.hidraw_backend import HidRawUSB, REPORT_SIZE
+
+class HidRawUSBTest(unittest.TestCase):
+    """
+    Drives the backend through a socketpair, which delivers reports as a stream
+    """
+    def setUp(self):
+        self.device, self.host = socket.socketpair()
+        self.usb = HidRawUSB(fd = self.host.fileno())
+        self.usb.init()
+        self.report = bytearray(i for i in range(REPORT_SIZE))
+
+    def tearDown(self):
+        self.usb.close()
+        self.device.close()
+        self.host.close()
+
+    def send(self, data, delay = 0):
+        def write():
+            time.sleep(delay)
+            self.device.sendall(bytes(data))
+        thread = Thread(target = write)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def testWriteReport(self):
+        self.usb.write(bytearray([1, 2, 3]))
+        received = self.device.recv(REPORT_SIZE + 1)
+        self.assertEqual(bytearray(received), bytearray([0, 1, 2, 3]) + bytearray(REPORT_SIZE - 3))
+
+    def testReportInPieces(self):
+        self.send(self.report[:10])
+        self.send(self.report[10:], 0.05).join()
+        buf = bytearray(REPORT_SIZE)
+        self.assertEqual(self.usb.readInto(buf, 1000), REPORT_SIZE)
+        self.assertEqual(buf, self.report)
+
+    def testTimeout(self):
+        began = default_timer()
+        with self.assertRaises(IOError) as context:
+            self.usb.read(50)
+        self.assertEqual(context.exception.errno, errno.ETIMEDOUT)
+        self.assertGreaterEqual(default_timer() - began, 0.045)
+
+    def testTimeoutCoversWholeReport(self):
+        #Pieces arriving within the timeout of each other must not extend it
+        def trickle():
+            for i in range(0, REPORT_SIZE, 8):
+                self.device.sendall(bytes(self.report[i:i+8]))
+                time.sleep(0.03)
+        thread = Thread(target = trickle)
+        thread.daemon = True
+        thread.start()
+        began = default_timer()
+        with self.assertRaises(IOError):
+            self.usb.read(100)
+        self.assertLess(default_timer() - began, 0.2)
+        thread.join()
+        self.assertEqual(self.usb.read(1000), self.report)
+
+    def testPartialReportKeptOnTimeout(self):
+        self.send(self.report[:20]).join()
+        with self.assertRaises(IOError) as context:
+            self.usb.read(50)
+        self.assertEqual(context.exception.errno, errno.ETIMEDOUT)
+        self.send(self.report[20:]).join()
+        self.assertEqual(self.usb.read(1000), self.report)
+        #The next report starts on its own boundary
+        self.send(self.report[::-1]).join()
+        self.assertEqual(self.usb.read(1000), self.report[::-1])
+
+    def testDisconnected(self):
+        self.device.shutdown(socket.SHUT_WR)
+        with self.assertRaises(IOError) as context:
+            self.usb.read(1000)
+        self.assertEqual(context.exception.errno, errno.EIO)
+
+if __name__ == "__main__":
+    unittest.main()
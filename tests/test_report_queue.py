@@ -0,0 +1,116 @@
+"""
+MicroNFCBoard Python API
+
+Copyright (c) 2014-2015 AppNearMe Ltd
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import errno, time, unittest
+from threading import Thread
+from timeit import default_timer
+from micronfcboard.interface.report_queue import ReportQueue, OVERFLOW_BLOCK
+
+# Usage: python -m unittest discover tests
+
+def start(target, *args):
+    thread = Thread(target = target, args = args)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+class ReportQueueTest(unittest.TestCase):
+    def testOrderFromProducerThread(self):
+        queue = ReportQueue(4, OVERFLOW_BLOCK)
+        def produce():
+            for i in range(1000):
+                queue.put(i)
+        producer = start(produce)
+        received = [queue.get(1000) for _ in range(1000)]
+        producer.join(1)
+        self.assertEqual(received, range(1000))
+        self.assertEqual(queue.dropped, 0)
+
+    def testPutBlocksWhenFull(self):
+        queue = ReportQueue(2, OVERFLOW_BLOCK)
+        queue.put(0)
+        queue.put(1)
+        producer = start(queue.put, 2)
+        producer.join(0.1)
+        self.assertTrue(producer.is_alive())
+        self.assertEqual(len(queue), 2)
+        self.assertEqual(queue.get(1000), 0)
+        producer.join(1)
+        self.assertFalse(producer.is_alive())
+        self.assertEqual([queue.get(1000), queue.get(1000)], [1, 2])
+        self.assertEqual(queue.dropped, 0)
+
+    def testPutTimeoutDropsReport(self):
+        queue = ReportQueue(1, OVERFLOW_BLOCK)
+        queue.put(0)
+        began = default_timer()
+        queue.put(1, 50)
+        self.assertGreaterEqual(default_timer() - began, 0.045)
+        self.assertEqual(queue.dropped, 1)
+        self.assertEqual(len(queue), 1)
+        self.assertEqual(queue.get(0), 0)
+
+    def testGetTimeout(self):
+        queue = ReportQueue()
+        began = default_timer()
+        with self.assertRaises(IOError) as context:
+            queue.get(50)
+        self.assertEqual(context.exception.errno, errno.ETIMEDOUT)
+        self.assertGreaterEqual(default_timer() - began, 0.045)
+
+    def testGetWaitsForProducer(self):
+        queue = ReportQueue()
+        def produce():
+            time.sleep(0.05)
+            queue.put("report")
+        start(produce)
+        self.assertEqual(queue.get(1000), "report")
+
+    def testCloseWakesBlockedReader(self):
+        queue = ReportQueue()
+        errors = []
+        def consume():
+            try:
+                queue.get()
+            except IOError as e:
+                errors.append(e.errno)
+        consumer = start(consume)
+        consumer.join(0.05)
+        self.assertTrue(consumer.is_alive())
+        queue.close()
+        consumer.join(1)
+        self.assertFalse(consumer.is_alive())
+        self.assertEqual(errors, [errno.EIO])
+
+    def testCloseWakesBlockedProducer(self):
+        queue = ReportQueue(1, OVERFLOW_BLOCK)
+        queue.put(0)
+        producer = start(queue.put, 1)
+        producer.join(0.05)
+        self.assertTrue(producer.is_alive())
+        queue.close()
+        producer.join(1)
+        self.assertFalse(producer.is_alive())
+        #Reports queued before closing can still be read
+        self.assertEqual(queue.get(0), 0)
+
+if __name__ == "__main__":
+    unittest.main()